@@ -1,5 +1,10 @@
 import numpy as np
 import tensorflow as tf
+from replay import Memory
+from env.vec_game import legal_actions
+from env.observation import to_exponents
+from numpy_policy import save_weights
+from metrics import History
 
 np.random.seed(42)
 tf.set_random_seed(42)
@@ -35,12 +40,22 @@ class DuelingDQN:
             start_epsilon=0,
             output_graph=False,
             sess=None,
+            memory=None,
+            fused_learn=False,
+            double_q=False,
+            mask_legal=False,
+            n_step=1,
     ):
         self.n_actions = n_actions
         self.n_features = n_features
+        # 16 features (exponent / 10) or 16 cells x 16 one-hot channels, see env/observation.py
+        self.n_channels = n_features // 16
         self.global_step = tf.Variable(0)  # count the number of steps taken.
         self.lr = learning_rate
         self.gamma = reward_decay
+        # the memory stores n-step returns (replay.NStepMemory), s_ is n steps ahead
+        self.n_step = n_step
+        self.gamma_n = reward_decay ** n_step
         self.epsilon_max = e_greedy
         self.replace_target_iter = replace_target_iter
         self.memory_size = memory_size
@@ -49,12 +64,24 @@ class DuelingDQN:
         self.epsilon = start_epsilon if e_greedy_increment is not None else self.epsilon_max
 
         self.learn_step_counter = 0
-        self.memory = np.zeros((self.memory_size, n_features*2+2))
-        self.memory_index = 0
+        # any object with store(s, a, r, s_, done) and sample(batch_size), see replay.py
+        self.memory = Memory(self.memory_size, n_features) if memory is None else memory
+        self.prioritized = getattr(self.memory, 'prioritized', False)
+        self.fused_learn = fused_learn
+        self.double_q = double_q
+        # bootstrap only from the moves that change the next board
+        self.mask_legal = mask_legal
         self._build_net()
-        t_params = tf.get_collection('target_net_params')
-        e_params = tf.get_collection('eval_net_params')
-        self.replace_target_op = [tf.assign(t, e) for t, e in zip(t_params, e_params)]
+        # the layers compute with the tf.Variable copies in t_params/e_params, not the get_variable collections
+        self.replace_target_op = [tf.assign(t, e) for t, e in zip(self.t_params, self.e_params)]
+        if self.fused_learn:
+            self._build_fused_learn()
+
+        # feeding the weights of the eval_net, e.g. copied from a learner process.
+        self._eval_params_in = [tf.placeholder(p.dtype.base_dtype, p.get_shape()) for p in self.e_params]
+        self._assign_eval_op = [tf.assign(p, v) for p, v in zip(self.e_params, self._eval_params_in)]
+
+        self.saver = tf.train.Saver(max_to_keep=1)
 
         if sess is None:
             self.sess = tf.Session()
@@ -63,20 +90,22 @@ class DuelingDQN:
             self.sess = sess
         if output_graph:
             tf.summary.FileWriter("logs/", self.sess.graph)
-        self.cost_his = []
+        self.cost_his = History()  # bounded, downsampled as it grows
 
     def _build_net(self):
-        def build_layers(x, c_names):
+        def build_layers(x, c_names, params):
             # n_l1, n_l2, n_l3, n_l4 = 64, 64, 128, 128
+            # params collects the variables the layers actually compute with.
 
             def make_conv_layer(k, i, _id):
                 w = weight_variable('w'+_id, k, c_names)
                 b = bias_variable('b'+_id, [k[-1]], c_names)
+                params.extend([w, b])
                 o = tf.nn.tanh(conv2d(i, w) + b)
                 return o
 
             # first conv layer.
-            conv_o1 = make_conv_layer([1, 1, 1, 64], x, "1")
+            conv_o1 = make_conv_layer([1, 1, self.n_channels, 64], x, "1")
 
             # second conv two-layer.
             conv_o11 = make_conv_layer([4, 1, 64, 128], conv_o1, "11")
@@ -90,17 +119,20 @@ class DuelingDQN:
             with tf.variable_scope('l4_fc'):
                 w4 = weight_variable('w4', [4*128*2, 256], c_names)
                 b4 = bias_variable('b4', [256], c_names)
+                params.extend([w4, b4])
                 l4 = tf.nn.tanh(tf.matmul(flat, w4) + b4)
 
             # fifth layer. Dueling DQN
             with tf.variable_scope('Value'):
                 w5 = weight_variable('w5', [256, 1], c_names)
                 b5 = bias_variable('b5', [1], c_names)
+                params.extend([w5, b5])
                 self.V = tf.matmul(l4, w5) + b5
 
             with tf.variable_scope('Advantage'):
                 w5 = weight_variable('w5', [256, self.n_actions], c_names)
                 b5 = bias_variable('b5', [self.n_actions], c_names)
+                params.extend([w5, b5])
                 self.A = tf.matmul(l4, w5) + b5
 
             with tf.variable_scope('Q'):
@@ -113,11 +145,14 @@ class DuelingDQN:
         self.q_target = tf.placeholder(tf.float32, [None, self.n_actions], name='Q_target')  # for calculating loss
         with tf.variable_scope('eval_net'):
             c_names = ['eval_net_params', tf.GraphKeys.GLOBAL_VARIABLES]
-            x = tf.reshape(self.s, [-1, 4, 4, 1])
-            self.q_eval = build_layers(x, c_names)
+            x = tf.reshape(self.s, [-1, 4, 4, self.n_channels])
+            self.e_params = []
+            self.q_eval = build_layers(x, c_names, self.e_params)
 
+        # importance-sampling weights of prioritized replay, all ones otherwise
+        self.ISWeights = tf.placeholder_with_default(tf.ones_like(self.q_eval[:, 0]), [None], name='IS_weights')
         with tf.variable_scope('loss'):
-            self.loss = tf.reduce_mean(tf.squared_difference(self.q_target, self.q_eval))
+            self.loss = tf.reduce_mean(self.ISWeights[:, tf.newaxis] * tf.squared_difference(self.q_target, self.q_eval))
         with tf.variable_scope('train'):
             self._train_op = tf.train.AdamOptimizer(self.lr).minimize(self.loss)
 
@@ -125,47 +160,174 @@ class DuelingDQN:
         self.s_ = tf.placeholder(tf.float32, [None, self.n_features], name='s_')    # input
         with tf.variable_scope('target_net'):
             c_names_ = ['target_net_params', tf.GraphKeys.GLOBAL_VARIABLES]
-            x_ = tf.reshape(self.s_, [-1, 4, 4, 1])
-            self.q_next = build_layers(x_, c_names_)
-
-    def store_transition(self, s, a, r, s_):
-        transition = np.hstack((s, [a, r], s_))
-        self.memory[self.memory_index, :] = transition
-        self.memory_index += 1
-        if self.memory_index == self.memory_size:
-            self.memory_index = 0
-
-    def choose_action(self, observation):
+            x_ = tf.reshape(self.s_, [-1, 4, 4, self.n_channels])
+            self.t_params = []
+            self.q_next = build_layers(x_, c_names_, self.t_params)
+
+    def _build_fused_learn(self):
+        """
+        Builds the whole update for a single session call: the Bellman target
+        is computed from s_, r and done inside the graph. With double_q the
+        eval_net is fed s and s_ stacked and picks the next action. The
+        target sync runs after the train op so it can be fetched in the same
+        call that precedes the sync of learn().
+        """
+        self.a = tf.placeholder(tf.int32, [None], name='a')
+        self.r = tf.placeholder(tf.float32, [None], name='r')
+        self.done = tf.placeholder(tf.float32, [None], name='done')
+        # legal moves of s_, all moves unless mask_legal
+        self.legal_ = tf.placeholder_with_default(tf.ones_like(self.q_next, dtype=tf.bool),
+                                                  [None, self.n_actions], name='legal_')
+        batch = tf.shape(self.a)[0]
+        q_eval = self.q_eval[:batch]
+
+        with tf.variable_scope('fused_target'):
+            illegal = tf.fill(tf.shape(self.q_next), -1e9)
+            if self.double_q:
+                q_eval_next = tf.where(self.legal_, tf.stop_gradient(self.q_eval[batch:]), illegal)
+                a_next = tf.argmax(q_eval_next, axis=1)
+                q_next = tf.reduce_sum(self.q_next * tf.one_hot(a_next, self.n_actions), axis=1)
+            else:
+                q_next = tf.reduce_max(tf.where(self.legal_, self.q_next, illegal), axis=1)
+            # a board without legal move has no future
+            q_next = tf.where(tf.reduce_any(self.legal_, axis=1), q_next, tf.zeros_like(q_next))
+            target = self.r + self.gamma_n * (1. - self.done) * q_next
+            a_one_hot = tf.one_hot(self.a, self.n_actions)
+            q_target = tf.stop_gradient(q_eval + a_one_hot * (target[:, tf.newaxis] - q_eval))
+            self.abs_errors = tf.abs(target - tf.reduce_sum(q_eval * a_one_hot, axis=1))
+
+        with tf.variable_scope('fused_loss'):
+            self.fused_loss = tf.reduce_mean(self.ISWeights[:batch, tf.newaxis] *
+                                             tf.squared_difference(q_target, q_eval))
+        with tf.variable_scope('fused_train'):
+            self._fused_train_op = tf.train.AdamOptimizer(self.lr).minimize(self.fused_loss)
+        with tf.control_dependencies([self._fused_train_op]):
+            self._fused_replace_op = [tf.assign(t, e.read_value()) for t, e in zip(self.t_params, self.e_params)]
+
+    def store_transition(self, s, a, r, s_, done=False):
+        self.memory.store(s, a, r, s_, done)
+
+    def get_eval_params(self):
+        return self.sess.run(self.e_params)
+
+    def set_eval_params(self, values):
+        self.sess.run(self._assign_eval_op, feed_dict=dict(zip(self._eval_params_in, values)))
+
+    def export_weights(self, path, dtype='float32'):
+        # snapshot of the eval_net for numpy_policy.NumpyDuelingNet, dtype float32, float16 or int8
+        save_weights(path, self.get_eval_params(), dtype)
+
+    def choose_action(self, observation, legal=None):
+        # legal: boolean mask of the moves to choose from, e.g. env.legal_actions()
+        if legal is not None and not legal.any():
+            legal = None  # lost board, every move is a no-op
         observation = observation[np.newaxis, :]
         if np.random.uniform() < self.epsilon:  # choosing action
             actions_value = self.sess.run(self.q_eval, feed_dict={self.s: observation})
+            if legal is not None:
+                actions_value[0, ~legal] = -np.inf
             action = np.argmax(actions_value)
+        elif legal is not None:
+            action = np.random.choice(np.flatnonzero(legal))
         else:
             action = np.random.randint(0, self.n_actions)
         return action
 
+    def choose_actions(self, observations, legal=None):
+        """
+        Epsilon-greedy actions for a (N, n_features) batch of observations with
+        one session call for all greedy rows. With a (N, n_actions) legal mask
+        both the greedy and the random actions are restricted to legal moves.
+        """
+        observations = np.asarray(observations)
+        n = len(observations)
+        if legal is None:
+            actions = np.random.randint(0, self.n_actions, size=n)
+        else:
+            legal = legal | ~legal.any(axis=1, keepdims=True)
+            actions = np.argmax(np.where(legal, np.random.uniform(size=legal.shape), -1.), axis=1)
+        greedy = np.random.uniform(size=n) < self.epsilon
+        if greedy.any():
+            actions_value = self.sess.run(self.q_eval, feed_dict={self.s: observations[greedy]})
+            if legal is not None:
+                actions_value[~legal[greedy]] = -np.inf
+            actions[greedy] = np.argmax(actions_value, axis=1)
+        return actions
+
+    def _legal_next(self, s_):
+        return legal_actions(to_exponents(s_))
+
+    def learn(self, options=None, run_metadata=None):
+        # options/run_metadata are passed to the session call of the train op, e.g. for tracing.
+        if self.fused_learn:
+            return self._learn_fused(options, run_metadata)
 
-    def learn(self):
         if self.learn_step_counter % self.replace_target_iter == 0:
             self.sess.run(self.replace_target_op)
 
-        sample_index = np.random.choice(self.memory_size, size=self.batch_size)
-        batch_memory = self.memory[sample_index, :]
+        if self.prioritized:
+            s, eval_act_index, reward, s_, done, sample_index, is_weights = self.memory.sample(self.batch_size)
+        else:
+            s, eval_act_index, reward, s_, done = self.memory.sample(self.batch_size)
 
-        q_next = self.sess.run(self.q_next, feed_dict={self.s_: batch_memory[:, -self.n_features:]})  # next observation
-        q_eval = self.sess.run(self.q_eval, {self.s: batch_memory[:, :self.n_features]})
+        q_next = self.sess.run(self.q_next, feed_dict={self.s_: s_})  # next observation
+        q_eval = self.sess.run(self.q_eval, {self.s: s})
 
         q_target = q_eval.copy()
 
         batch_index = np.arange(self.batch_size, dtype=np.int32)
-        eval_act_index = batch_memory[:, self.n_features].astype(int)
-        reward = batch_memory[:, self.n_features + 1]
 
-        q_target[batch_index, eval_act_index] = reward + self.gamma * np.max(q_next, axis=1)
+        if self.mask_legal:
+            legal_ = self._legal_next(s_)
+            q_next_max = np.where(legal_, q_next, -np.inf).max(axis=1)
+            q_next_max[~legal_.any(axis=1)] = 0.
+        else:
+            q_next_max = np.max(q_next, axis=1)
+        # a lost board has no future
+        q_target[batch_index, eval_act_index] = reward + self.gamma_n * (1. - done) * q_next_max
+
+        if self.prioritized:
+            abs_errors = np.abs(q_target[batch_index, eval_act_index] - q_eval[batch_index, eval_act_index])
+            self.memory.update_priorities(sample_index, abs_errors)
+            _, self.cost = self.sess.run([self._train_op, self.loss],
+                                         feed_dict={self.s: s,
+                                                    self.q_target: q_target,
+                                                    self.ISWeights: is_weights},
+                                         options=options, run_metadata=run_metadata)
+        else:
+            _, self.cost = self.sess.run([self._train_op, self.loss],
+                                         feed_dict={self.s: s,
+                                                    self.q_target: q_target},
+                                         options=options, run_metadata=run_metadata)
+        self.cost_his.append(self.cost)
+
+        self.epsilon = self.epsilon + self.epsilon_increment if self.epsilon < self.epsilon_max else self.epsilon_max
+        self.learn_step_counter += 1
 
-        _, self.cost = self.sess.run([self._train_op, self.loss],
-                                     feed_dict={self.s: batch_memory[:, :self.n_features],
-                                                self.q_target: q_target})
+    def _learn_fused(self, options=None, run_metadata=None):
+        if self.learn_step_counter == 0:
+            self.sess.run(self.replace_target_op)
+
+        if self.prioritized:
+            s, a, r, s_, done, sample_index, is_weights = self.memory.sample(self.batch_size)
+        else:
+            s, a, r, s_, done = self.memory.sample(self.batch_size)
+
+        feed_dict = {self.s: np.vstack((s, s_)) if self.double_q else s,
+                     self.s_: s_, self.a: a, self.r: r, self.done: done}
+        if self.prioritized:
+            feed_dict[self.ISWeights] = is_weights
+        if self.mask_legal:
+            feed_dict[self.legal_] = self._legal_next(s_)
+        fetches = [self._fused_train_op, self.fused_loss, self.abs_errors]
+        # replace_target_op of the next learn() runs right after this update
+        if (self.learn_step_counter + 1) % self.replace_target_iter == 0:
+            fetches.append(self._fused_replace_op)
+
+        _, self.cost, abs_errors = self.sess.run(fetches, feed_dict=feed_dict, options=options,
+                                                 run_metadata=run_metadata)[:3]
+        if self.prioritized:
+            self.memory.update_priorities(sample_index, abs_errors)
         self.cost_his.append(self.cost)
 
         self.epsilon = self.epsilon + self.epsilon_increment if self.epsilon < self.epsilon_max else self.epsilon_max
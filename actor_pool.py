@@ -0,0 +1,200 @@
+"""
+Multiprocess training: K actor processes play their own games with a NumPy
+copy of the eval_net and write transitions into a shared-memory ring buffer, the
+learner process samples from it and publishes its weights periodically.
+"""
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import argparse
+import random
+import time
+import numpy as np
+from env.engines import ENGINES
+from numpy_policy import NumpyDuelingNet
+from replay import NStepMemory, SharedReplay
+from metrics import Metrics
+
+
+class SharedWeights:
+    """
+    Class SharedWeights
+    Flat float32 copy of the eval_net weights in shared memory guarded by a
+    sequence counter: the counter is odd while the learner writes, so a
+    reader retries when it changed during its copy.
+    """
+    def __init__(self, shapes, name=None):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        size = 8 + 4 * sum(self.sizes)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.version = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.flat = np.ndarray((sum(self.sizes),), dtype=np.float32, buffer=self.shm.buf, offset=8)
+        if self.owner:
+            self.version[0] = 0
+
+    def publish(self, values):
+        self.version[0] += 1
+        self.flat[:] = np.concatenate([np.ravel(v) for v in values])
+        self.version[0] += 1
+
+    def read(self, last_version=-1):
+        """
+        This function returns (version, weights) or (last_version, None) when
+        nothing new was published since last_version.
+        """
+        while True:
+            version = int(self.version[0])
+            if version == last_version or version == 0:
+                return last_version, None
+            if version % 2 == 1:
+                time.sleep(0.001)
+                continue
+            flat = self.flat.copy()
+            if int(self.version[0]) == version:
+                break
+        values = []
+        offset = 0
+        for shape, size in zip(self.shapes, self.sizes):
+            values.append(flat[offset:offset + size].reshape(shape))
+            offset += size
+        return version, values
+
+    def close(self):
+        self.version = None
+        self.flat = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def actor_epsilon(worker_id, step, config):
+    """
+    This function returns the probability of a greedy action of an actor.
+    Like DuelingDQN.epsilon it grows by epsilon_increment per step up to
+    epsilon_max; worker i starts at epsilon_start[i % len(epsilon_start)].
+    """
+    start = config['epsilon_start'][worker_id % len(config['epsilon_start'])]
+    return min(start + config['epsilon_increment'] * step, config['epsilon_max'])
+
+
+def actor_worker(worker_id, config, replay_name, weights_name, weights_shapes, score_queue, stop_event):
+    # actors run the eval_net with NumPy and never import TensorFlow
+    np.random.seed(config['seed'] + worker_id)
+    random.seed(config['seed'] + worker_id)
+    replay = SharedReplay(config['memory_size'], config['n_features'], config['workers'],
+                          name=replay_name, writer_id=worker_id)
+    weights = SharedWeights(weights_shapes, name=weights_name)
+    memory = NStepMemory(replay, config['n_step'], config['reward_decay']) if config['n_step'] > 1 else replay
+    env = ENGINES[config['engine']]()
+    version, values = weights.read()
+    RL = NumpyDuelingNet(values, env.n_actions)
+
+    step = 0
+    observation = env.reset()
+    while not stop_event.is_set():
+        if step % config['sync_interval'] == 0:
+            version, values = weights.read(version)
+            if values is not None:
+                RL.set_params(values)
+        RL.epsilon = actor_epsilon(worker_id, step, config)
+
+        action = RL.choose_action(observation, env.legal_actions() if config['mask_legal'] else None)
+        observation_, reward, done = env.step(action)
+        memory.store(observation, action, reward, observation_, done)
+        observation = observation_
+        step += 1
+        if done:
+            score_queue.put((worker_id, env.score, RL.epsilon))
+            observation = env.reset()
+
+    replay.close()
+    weights.close()
+
+
+def train_actor_pool(config):
+    from RL_brain import DuelingDQN
+
+    replay = SharedReplay(config['memory_size'], config['n_features'], config['workers'])
+    RL = DuelingDQN(config['n_actions'],
+                    config['n_features'],
+                    learning_rate=1e-4,
+                    reward_decay=config['reward_decay'],
+                    memory_size=replay.capacity,
+                    memory=replay,
+                    mask_legal=config['mask_legal'],
+                    n_step=config['n_step'])
+    params = RL.get_eval_params()
+    weights = SharedWeights([p.shape for p in params])
+    weights.publish(params)
+
+    ctx = mp.get_context('spawn')
+    score_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    workers = [ctx.Process(target=actor_worker,
+                           args=(i, config, replay.name, weights.name, weights.shapes, score_queue, stop_event),
+                           daemon=True)
+               for i in range(config['workers'])]
+    for w in workers:
+        w.start()
+
+    metrics = Metrics()
+    try:
+        while replay.total_stored() < config['learn_start']:
+            time.sleep(0.1)
+        start = time.time()
+        stored_start = replay.total_stored()
+        for update in range(1, config['updates'] + 1):
+            RL.learn()
+            metrics.add('loss', RL.cost)
+            if update % config['sync_interval'] == 0:
+                weights.publish(RL.get_eval_params())
+
+            while not score_queue.empty():
+                metrics.add('score', score_queue.get()[1])
+            if update % config['report_interval'] == 0:
+                elapsed = time.time() - start
+                print("#" * 80)
+                print("update", update, ",cost:", RL.cost,
+                      ",updates/sec: {:.1f}".format(update / elapsed),
+                      ",transitions/sec: {:.1f}".format((replay.total_stored() - stored_start) / elapsed))
+                if metrics['score'].count:
+                    print("games:", metrics['score'].count, "avg-score: {}".format(metrics['score'].mean))
+    finally:
+        stop_event.set()
+        for w in workers:
+            w.join(timeout=5)
+            if w.is_alive():
+                w.terminate()
+        replay.close()
+        weights.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=max(1, mp.cpu_count() - 1))
+    parser.add_argument('--sync-interval', type=int, default=100,
+                        help="learner updates between weight publications / actor steps between weight reads")
+    parser.add_argument('--epsilon-start', type=float, nargs='+', default=[0.5],
+                        help="greedy probability of every actor at start, cycled over the actors")
+    parser.add_argument('--epsilon-max', type=float, default=0.99)
+    parser.add_argument('--epsilon-increment', type=float, default=1e-5)
+    parser.add_argument('--memory-size', type=int, default=100000)
+    parser.add_argument('--learn-start', type=int, default=5000)
+    parser.add_argument('--updates', type=int, default=20000000)
+    parser.add_argument('--report-interval', type=int, default=100)
+    parser.add_argument('--engine', default='bitboard')
+    parser.add_argument('--mask-legal', action='store_true',
+                        help="choose and bootstrap only from moves that change the board")
+    parser.add_argument('--n-step', type=int, default=1,
+                        help="actors store n-step returns, the learner bootstraps with reward_decay ** n")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    config = dict(vars(args), n_actions=4, n_features=16, reward_decay=0.95)
+    train_actor_pool(config)
@@ -0,0 +1,56 @@
+"""
+Timing helpers shared by the benchmarks: every measurement warms up, repeats
+and returns a JSON-serializable record.
+"""
+import platform
+import subprocess
+import time
+import numpy as np
+
+
+def measure(name, fn, number, repeats=5, warmup=1, unit='ops/sec', **params):
+    """
+    This function calls fn() warmup times untimed and repeats times timed.
+    Every call is expected to do `number` operations unless it returns the
+    number of operations it actually did. With unit 'ops/sec' the record
+    holds rates, with unit 'us' the latency of one operation.
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    counts = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        done = fn()
+        times.append(time.perf_counter() - start)
+        counts.append(number if done is None else done)
+    times = np.array(times)
+    counts = np.array(counts, dtype=np.float64)
+    if unit == 'us':
+        values = times / counts * 1e6
+    else:
+        values = counts / times
+    return {'name': name,
+            'params': params,
+            'unit': unit,
+            'median': float(np.median(values)),
+            'mean': float(np.mean(values)),
+            'min': float(np.min(values)),
+            'max': float(np.max(values)),
+            'repeats': repeats,
+            'warmup': warmup,
+            'number': number,
+            'executed': float(np.mean(counts))}
+
+
+def machine_info():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor()}
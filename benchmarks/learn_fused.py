@@ -0,0 +1,48 @@
+"""
+Updates per second of DuelingDQN.learn() with the three session calls of the
+host-side target versus the fused in-graph target.
+    python -m benchmarks.learn_fused
+"""
+import argparse
+import time
+import numpy as np
+import tensorflow as tf
+from RL_brain import DuelingDQN
+from replay import PackedMemory
+
+
+def filled_memory(memory_size, seed=0):
+    rng = np.random.RandomState(seed)
+    memory = PackedMemory(memory_size)
+    for _ in range(memory_size):
+        s = rng.randint(0, 12, size=16) / 10
+        s_ = rng.randint(0, 12, size=16) / 10
+        memory.store(s, rng.randint(0, 4), rng.uniform(-1, 1), s_, rng.uniform() < 0.01)
+    return memory
+
+
+def updates_per_second(memory, batch_size, updates, **kwargs):
+    tf.reset_default_graph()
+    RL = DuelingDQN(4, 16, batch_size=batch_size, memory_size=memory.memory_size, memory=memory, **kwargs)
+    for _ in range(5):  # warm up
+        RL.learn()
+    start = time.time()
+    for _ in range(updates):
+        RL.learn()
+    elapsed = time.time() - start
+    RL.sess.close()
+    return updates / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--updates', type=int, default=200)
+    args = parser.parse_args()
+
+    memory = filled_memory(20000)
+    for name, kwargs in [('three calls', {}),
+                         ('fused', {'fused_learn': True}),
+                         ('fused double-q', {'fused_learn': True, 'double_q': True})]:
+        print("{:16s} {:8.1f} updates/sec".format(name, updates_per_second(memory, args.batch_size,
+                                                                           args.updates, **kwargs)))
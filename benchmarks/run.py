@@ -0,0 +1,229 @@
+"""
+Benchmark suite for the hot paths of the environment, the replay memories
+and the learner. Results are written as JSON so that runs of different
+commits can be compared.
+    python -m benchmarks.run [--only game_step learn ...] [--output results.json]
+"""
+from contextlib import redirect_stdout
+import argparse
+import io
+import itertools
+import json
+import random
+import sys
+import tempfile
+import numpy as np
+from benchmarks.harness import measure, machine_info
+
+
+def random_actions(n, seed=0):
+    return np.random.RandomState(seed).randint(0, 4, size=n).tolist()
+
+
+def bench_game_step(args):
+    from env.game import Game
+    from env.bitboard import BitboardGame
+    from env.vec_game import VecGame
+
+    records = []
+    number = args.steps
+    for (name, engine), reuse in itertools.product([('list', Game), ('bitboard', BitboardGame)], [False, True]):
+        random.seed(0)
+        env = engine(reuse_observations=reuse)
+        actions = random_actions(number)
+
+        def run():
+            env.reset()
+            for action in actions:
+                if env.step(action)[2]:
+                    env.reset()
+        records.append(measure('game_step', run, number, args.repeats, args.warmup, engine=name,
+                               reuse_observations=reuse))
+
+    n_boards = 4096
+    vec_env = VecGame(n_boards, seed=0)
+    vec_actions = np.random.RandomState(0).randint(0, 4, size=(20, n_boards))
+
+    def run_vec():
+        for actions in vec_actions:
+            vec_env.step(actions)
+    records.append(measure('game_step', run_vec, 20 * n_boards, args.repeats, args.warmup,
+                           engine='vec', n_boards=n_boards))
+    return records
+
+
+def bench_format_state(args):
+    from env.game import Game, format_state
+    from env.bitboard import BitboardGame
+
+    random.seed(0)
+    env = Game()
+    for action in random_actions(50):
+        env.step(action)
+    state = np.array(env.field).flatten()
+    number = args.steps
+
+    def run():
+        for _ in range(number):
+            format_state(state)
+    records = [measure('format_state', run, number, args.repeats, args.warmup, unit='us')]
+
+    # encoding of the current field/board as done by reset() and step()
+    for (name, engine), one_hot in itertools.product([('list', Game), ('bitboard', BitboardGame)], [False, True]):
+        random.seed(0)
+        env = engine(one_hot=one_hot, reuse_observations=True)
+        for action in random_actions(50):
+            env.step(action)
+
+        def run_observation():
+            for _ in range(number):
+                env.observation()
+        records.append(measure('observation', run_observation, number, args.repeats, args.warmup, unit='us',
+                               engine=name, one_hot=one_hot))
+    return records
+
+
+def build_dqn(**kwargs):
+    import tensorflow as tf
+    from RL_brain import DuelingDQN
+
+    tf.reset_default_graph()
+    return DuelingDQN(4, 16, **kwargs)
+
+
+def bench_store_transition(args):
+    from replay import MEMORIES
+
+    rng = np.random.RandomState(0)
+    transitions = [(rng.randint(0, 12, size=16) / 10, rng.randint(0, 4), rng.uniform(-1, 1),
+                    rng.randint(0, 12, size=16) / 10, False) for _ in range(1000)]
+    records = []
+    for name, memory_class in sorted(MEMORIES.items()):
+        if name == 'memmap':
+            memory = memory_class(100000, 16, path=tempfile.mkdtemp())
+        else:
+            memory = memory_class(100000, 16)
+        RL = build_dqn(memory_size=100000, memory=memory)
+        number = args.steps
+
+        def run():
+            for i in range(number):
+                RL.store_transition(*transitions[i % len(transitions)])
+        records.append(measure('store_transition', run, number, args.repeats, args.warmup, memory=name))
+        RL.sess.close()
+    return records
+
+
+def bench_learn(args):
+    from benchmarks.learn_fused import filled_memory
+
+    memory = filled_memory(20000)
+    records = []
+    for batch_size in args.batch_sizes:
+        for mode, kwargs in [('three_calls', {}), ('fused', {'fused_learn': True})]:
+            RL = build_dqn(batch_size=batch_size, memory_size=memory.memory_size, memory=memory, **kwargs)
+            number = args.updates
+
+            def run():
+                for _ in range(number):
+                    RL.learn()
+            records.append(measure('learn', run, number, args.repeats, args.warmup,
+                                   batch_size=batch_size, mode=mode))
+            RL.sess.close()
+    return records
+
+
+def bench_choose_action(args):
+    RL = build_dqn(memory_size=1, e_greedy=1.)  # always evaluate the network
+    observations = np.random.RandomState(0).randint(0, 12, size=(256, 16)) / 10
+    number = 256
+
+    def run():
+        for observation in observations:
+            RL.choose_action(observation)
+
+    def run_batched():
+        RL.choose_actions(observations)
+    records = [measure('choose_action', run, number, args.repeats, args.warmup, unit='us', backend='tf'),
+               measure('choose_actions', run_batched, number, args.repeats, args.warmup, unit='us',
+                       backend='tf', n_observations=number)]
+
+    from numpy_policy import NumpyDuelingNet
+    net = NumpyDuelingNet(RL.get_eval_params())
+
+    def run_numpy():
+        for observation in observations:
+            net.choose_action(observation)
+    records.append(measure('choose_action', run_numpy, number, args.repeats, args.warmup, unit='us',
+                           backend='numpy'))
+    RL.sess.close()
+    return records
+
+
+def bench_train_2048(args):
+    from env.bitboard import BitboardGame
+    from replay import MEMORIES
+    from run_this import train_2048
+    from pipeline import train_threaded
+
+    records = []
+    for memory_name, mode in [('dense', 'serial'), ('packed', 'serial'), ('packed', 'threaded')]:
+        random.seed(0)
+        np.random.seed(0)
+        env = BitboardGame()
+        RL = build_dqn(memory_size=500, memory=MEMORIES[memory_name](500, 16),
+                       e_greedy=0.99, start_epsilon=0.5, e_greedy_increment=1e-5)
+        number = args.train_steps
+        learn_start = 500
+
+        def train(max_steps, learn_start):
+            # both stop at max_steps or, train_2048, at the end of that episode and return the steps done
+            with redirect_stdout(io.StringIO()):
+                if mode == 'threaded':
+                    return train_threaded(env, RL, learn_start=learn_start, max_steps=max_steps)
+                return train_2048(env, RL, max_steps=max_steps, learn_start=learn_start)
+
+        # the steps before the first learn() are timed separately, the repeats learn from their first step
+        records.append(measure('train_2048_warmup', lambda: train(learn_start, learn_start), learn_start, 1, 0,
+                               memory=memory_name, mode=mode))
+
+        def run():
+            return train(number, 0)
+        records.append(measure('train_2048', run, number, args.repeats, args.warmup, memory=memory_name, mode=mode))
+        RL.sess.close()
+    return records
+
+
+BENCHMARKS = {'game_step': bench_game_step,
+              'format_state': bench_format_state,
+              'store_transition': bench_store_transition,
+              'learn': bench_learn,
+              'choose_action': bench_choose_action,
+              'train_2048': bench_train_2048}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=10000, help="operations per repeat of the cheap benchmarks")
+    parser.add_argument('--updates', type=int, default=20, help="learn() calls per repeat")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 128, 512])
+    parser.add_argument('--train-steps', type=int, default=2000, help="train_2048 step budget per repeat")
+    parser.add_argument('--output', help="JSON file, printed to stdout when omitted")
+    args = parser.parse_args()
+
+    results = {'machine': machine_info(), 'args': vars(args), 'results': []}
+    for name in args.only:
+        for record in BENCHMARKS[name](args):
+            params = " ".join("{}={}".format(k, v) for k, v in sorted(record['params'].items()))
+            print("{:18s} {:32s} {:14.2f} {}".format(record['name'], params, record['median'], record['unit']),
+                  file=sys.stderr)
+            results['results'].append(record)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,99 @@
+"""
+Checkpoints of a training run. A checkpoint directory holds
+ - model.ckpt.*      all TF variables incl. the Adam slots (tf.train.Saver)
+ - memory_<key>.npy  the replay memory arrays, raw .npy so they are
+                     memory-mapped back on resume instead of parsed
+ - state.pkl         DuelingDQN bookkeeping, replay indices, the game, the
+                     score window and the random number generator states
+ - args.json         the command line of the run
+A new checkpoint is written next to the old one and swapped in by rename.
+"""
+import json
+import os
+import pickle
+import random
+import shutil
+import signal
+import numpy as np
+
+
+def save_checkpoint(path, RL, train_state, args=None):
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    RL.saver.save(RL.sess, os.path.join(tmp_path, 'model.ckpt'), write_meta_graph=False)
+    arrays, values = RL.memory.get_state()
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_path, 'memory_{}.npy'.format(key)), array)
+
+    state = {'epsilon': RL.epsilon,
+             'learn_step_counter': RL.learn_step_counter,
+             'memory_values': values,
+             'memory_keys': sorted(arrays),
+             'random_state': random.getstate(),
+             'np_random_state': np.random.get_state(),
+             'train_state': train_state}
+    with open(os.path.join(tmp_path, 'state.pkl'), 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    if args is not None:
+        with open(os.path.join(tmp_path, 'args.json'), 'w') as f:
+            json.dump(args, f, indent=2)
+
+    old_path = path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_args(path):
+    with open(os.path.join(path, 'args.json')) as f:
+        return json.load(f)
+
+
+def load_checkpoint(path, RL):
+    """
+    This function restores RL and the random number generators and returns
+    the train_state passed to save_checkpoint. The memory arrays are opened
+    copy-on-write, so pages are read lazily and the files stay untouched.
+    """
+    RL.saver.restore(RL.sess, os.path.join(path, 'model.ckpt'))
+    with open(os.path.join(path, 'state.pkl'), 'rb') as f:
+        state = pickle.load(f)
+    arrays = {key: np.load(os.path.join(path, 'memory_{}.npy'.format(key)), mmap_mode='c')
+              for key in state['memory_keys']}
+    RL.memory.set_state(arrays, state['memory_values'])
+    RL.epsilon = state['epsilon']
+    RL.learn_step_counter = state['learn_step_counter']
+    random.setstate(state['random_state'])
+    np.random.set_state(state['np_random_state'])
+    return state['train_state']
+
+
+class Checkpointer:
+    """
+    Class Checkpointer
+    Decides when train_2048 writes a checkpoint: every `every` episodes and
+    as soon as SIGTERM/SIGINT arrives, after which training stops.
+    """
+    def __init__(self, path, every=1000, args=None):
+        self.path = path
+        self.every = every
+        self.args = args
+        self.stop_requested = False
+
+    def install_signal_handlers(self):
+        def handler(signum, frame):
+            print("signal", signum, "received, checkpointing...")
+            self.stop_requested = True
+        signal.signal(signal.SIGTERM, handler)
+        signal.signal(signal.SIGINT, handler)
+
+    def due(self, episode):
+        return self.stop_requested or (self.every > 0 and (episode + 1) % self.every == 0)
+
+    def save(self, RL, train_state):
+        save_checkpoint(self.path, RL, train_state, self.args)
+        print("checkpoint written to", self.path)
@@ -0,0 +1,442 @@
+"""
+Distributed experience collection over TCP: actor clients on any number of
+machines play with a NumPy copy of the eval_net and send batches of packed
+transitions to a replay server inside the learner process, which stores them
+into its replay memory and serves weight snapshots back.
+    python distributed.py learner --port 5555 --actors 2      # learner + 2 local actors
+    python distributed.py actor --host LEARNER --port 5555 --actors 4
+Every actor keeps one connection for its whole run. A batch is acknowledged
+only after it was stored and the learner kept up with the replay ratio, so
+actors that run ahead block on the acknowledgement (backpressure). The
+learner sends its settings on connect, remote actors only need the address.
+"""
+import argparse
+import io
+import json
+import multiprocessing as mp
+import random
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from actor_pool import actor_epsilon
+from env.engines import ENGINES
+from metrics import Metrics
+from numpy_policy import DTYPES, NumpyDuelingNet, load_weights, save_weights
+from pipeline import LockedMemory, ReplayRatioLimiter
+from replay import NStepMemory, PackedMemory, PrioritizedMemory, pack_states
+
+# every message: type, payload bytes
+HEADER = struct.Struct('<BI')
+# larger frames are treated as a broken connection instead of being allocated
+MAX_MESSAGE = 64 << 20
+HELLO, TRANSITIONS, ACK, GET_WEIGHTS, WEIGHTS = range(5)
+# TRANSITIONS payload: number of transitions and of finished game scores, then the arrays
+BATCH = struct.Struct('<II')
+VERSION = struct.Struct('<q')
+# packed layout of PackedMemory, 22 bytes per transition
+FIELDS = [('s', np.uint64), ('a', np.uint8), ('r', np.float32), ('s_', np.uint64), ('done', np.bool_)]
+
+
+def send_message(sock, kind, payload=b''):
+    sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+
+def recv_exactly(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        received = sock.recv_into(view[pos:])
+        if received == 0:
+            raise ConnectionError("connection closed")
+        pos += received
+    return buf
+
+
+def recv_message(sock):
+    kind, size = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    if size > MAX_MESSAGE:
+        raise ConnectionError("message of {} bytes exceeds MAX_MESSAGE".format(size))
+    return kind, recv_exactly(sock, size)
+
+
+def encode_batch(s, a, r, s_, done, scores=()):
+    """
+    This function serializes packed transitions (uint64 boards) and the
+    scores of the games finished since the last batch.
+    """
+    parts = [BATCH.pack(len(a), len(scores))]
+    parts.extend(np.ascontiguousarray(x, dtype=dtype).tobytes() for x, (_, dtype) in zip((s, a, r, s_, done), FIELDS))
+    parts.append(np.asarray(scores, dtype=np.int64).tobytes())
+    return b''.join(parts)
+
+
+def decode_batch(payload):
+    """
+    This function returns ((s, a, r, s_, done), scores) as arrays viewing
+    the payload of encode_batch.
+    """
+    n, n_scores = BATCH.unpack_from(payload)
+    offset = BATCH.size
+    arrays = []
+    for _, dtype in FIELDS:
+        arrays.append(np.frombuffer(payload, dtype=dtype, count=n, offset=offset))
+        offset += n * np.dtype(dtype).itemsize
+    return arrays, np.frombuffer(payload, dtype=np.int64, count=n_scores, offset=offset)
+
+
+class ReplayServer:
+    """
+    Class ReplayServer
+    Accepts actor connections on (host, port) with one thread per
+    connection. A received batch goes into the memory with one
+    store_packed() call and is acknowledged with the latest weights version
+    once the limiter lets the actor continue. publish() replaces the weight
+    snapshot served to GET_WEIGHTS, encoded once with save_weights in
+    weights_dtype. Every connection gets config and its worker id in HELLO.
+    Initial weights passed as values are published before the first
+    connection is accepted, so no actor sees an empty snapshot.
+    """
+    def __init__(self, memory, limiter, config, host='127.0.0.1', port=0, weights_dtype='float32', values=None):
+        self.memory = memory
+        self.limiter = limiter
+        self.config = config
+        self.weights_dtype = weights_dtype
+        self.lock = threading.Lock()
+        self.version = 0
+        self.snapshot = b''
+        self.transitions = 0
+        self.scores = []
+        self.n_clients = 0
+        self.connections = []
+        self.closed = False
+        if values is not None:
+            self.publish(values)
+        self.listener = socket.create_server((host, port))
+        self.listener.settimeout(0.5)  # accept() checks self.closed
+        self.address = self.listener.getsockname()
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def publish(self, values):
+        f = io.BytesIO()
+        save_weights(f, values, self.weights_dtype)
+        with self.lock:
+            self.version += 1
+            self.snapshot = f.getvalue()
+
+    def drain_scores(self):
+        with self.lock:
+            scores, self.scores = self.scores, []
+        return scores
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                conn, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.settimeout(None)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                worker_id = self.n_clients
+                self.n_clients += 1
+                self.connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn, worker_id), daemon=True).start()
+
+    def _serve(self, conn, worker_id):
+        try:
+            send_message(conn, HELLO, json.dumps(dict(self.config, worker_id=worker_id)).encode())
+            while not self.closed:
+                kind, payload = recv_message(conn)
+                if kind == TRANSITIONS:
+                    (s, a, r, s_, done), scores = decode_batch(payload)
+                    self.memory.store_packed(s, a, r, s_, done)
+                    with self.lock:
+                        self.transitions += len(a)
+                        self.scores.extend(scores.tolist())
+                    self.limiter.add_transition(len(a))  # waits while the learner is behind
+                    send_message(conn, ACK, VERSION.pack(self.version))
+                elif kind == GET_WEIGHTS:
+                    known, = VERSION.unpack(payload)
+                    with self.lock:
+                        version, snapshot = self.version, self.snapshot
+                    send_message(conn, WEIGHTS, VERSION.pack(version) + (snapshot if version != known else b''))
+                else:
+                    raise ValueError("unexpected message type {}".format(kind))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.closed = True
+        self.limiter.stop()
+        self.listener.close()
+        with self.lock:
+            connections = list(self.connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        self.thread.join()
+
+
+class ReplayClient:
+    """
+    Class ReplayClient
+    The actor end of one persistent connection to a ReplayServer. The
+    connection is retried for connect_timeout seconds, so actors may start
+    before the learner.
+    """
+    def __init__(self, host, port, connect_timeout=30.):
+        deadline = time.time() + connect_timeout
+        while True:
+            try:
+                self.sock = socket.create_connection((host, port))
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        kind, payload = recv_message(self.sock)
+        if kind != HELLO:
+            raise ConnectionError("expected HELLO, got message type {}".format(kind))
+        self.config = json.loads(payload.decode())
+
+    def send_transitions(self, s, a, r, s_, done, scores=()):
+        """
+        This function sends packed transitions, waits until the server
+        acknowledges them and returns the server's weights version.
+        """
+        send_message(self.sock, TRANSITIONS, encode_batch(s, a, r, s_, done, scores))
+        kind, payload = recv_message(self.sock)
+        if kind != ACK:
+            raise ConnectionError("expected ACK, got message type {}".format(kind))
+        return VERSION.unpack(payload)[0]
+
+    def get_weights(self, version=-1):
+        """
+        This function returns (version, weights) or (version, None) when the
+        server has nothing newer than the passed version.
+        """
+        send_message(self.sock, GET_WEIGHTS, VERSION.pack(version))
+        kind, payload = recv_message(self.sock)
+        if kind != WEIGHTS:
+            raise ConnectionError("expected WEIGHTS, got message type {}".format(kind))
+        new_version, = VERSION.unpack_from(payload)
+        if len(payload) == VERSION.size:
+            return version, None
+        return new_version, load_weights(io.BytesIO(payload[VERSION.size:]))
+
+    def close(self):
+        self.sock.close()
+
+
+class TransitionBatcher:
+    """
+    Class TransitionBatcher
+    Replay memory interface of an actor: store() fills preallocated arrays
+    and every batch_size transitions they are packed and sent through the
+    client. The scores of finished games ride along with the next batch;
+    server_version is the weights version of the last acknowledgement.
+    """
+    def __init__(self, client, batch_size=256, n_features=16):
+        self.client = client
+        self.s = np.zeros((batch_size, n_features))
+        self.a = np.zeros(batch_size, dtype=np.uint8)
+        self.r = np.zeros(batch_size, dtype=np.float32)
+        self.s_ = np.zeros((batch_size, n_features))
+        self.done = np.zeros(batch_size, dtype=np.bool_)
+        self.n = 0
+        self.scores = []
+        self.server_version = 0
+
+    def store(self, s, a, r, s_, done=False):
+        i = self.n
+        self.s[i] = s
+        self.a[i] = a
+        self.r[i] = r
+        self.s_[i] = s_
+        self.done[i] = done
+        self.n += 1
+        if self.n == len(self.a):
+            self.flush()
+
+    def flush(self):
+        n = self.n
+        self.server_version = self.client.send_transitions(pack_states(self.s[:n]), self.a[:n], self.r[:n],
+                                                           pack_states(self.s_[:n]), self.done[:n], self.scores)
+        self.n = 0
+        self.scores = []
+
+
+def run_actor(host, port, seed=0):
+    """
+    This function plays games for the learner at (host, port) until the
+    connection is closed and returns the number of steps taken.
+    """
+    client = ReplayClient(host, port)
+    config = client.config
+    worker_id = config['worker_id']
+    np.random.seed(seed + worker_id)
+    random.seed(seed + worker_id)
+    batcher = TransitionBatcher(client, config['transfer_batch'])
+    memory = NStepMemory(batcher, config['n_step'], config['reward_decay']) if config['n_step'] > 1 else batcher
+    env = ENGINES[config['engine']](reuse_observations=True)
+    version, values = client.get_weights()
+    RL = NumpyDuelingNet(values, env.n_actions)
+
+    step = 0
+    observation = env.reset()
+    try:
+        while True:
+            if step % config['sync_interval'] == 0 and batcher.server_version != version:
+                new_version, values = client.get_weights(version)
+                if values is not None:
+                    RL.set_params(values)
+                    version = new_version
+            RL.epsilon = actor_epsilon(worker_id, step, config)
+
+            action = RL.choose_action(observation, env.legal_actions() if config['mask_legal'] else None)
+            observation_, reward, done = env.step(action)
+            memory.store(observation, action, reward, observation_, done)
+            observation = observation_
+            step += 1
+            if done:
+                batcher.scores.append(env.score)
+                observation = env.reset()
+    except ConnectionError:
+        pass  # the learner is done
+    finally:
+        client.close()
+    return step
+
+
+def train_distributed(config):
+    """
+    This function runs the learner: a ReplayServer on (host, port), the
+    given number of local actor processes and config['updates'] updates,
+    paced by the replay ratio. Returns the number of updates.
+    """
+    from RL_brain import DuelingDQN
+
+    memory_class = PrioritizedMemory if config['prioritized'] else PackedMemory
+    memory = LockedMemory(memory_class(config['memory_size']))
+    RL = DuelingDQN(config['n_actions'],
+                    config['n_features'],
+                    learning_rate=1e-4,
+                    reward_decay=config['reward_decay'],
+                    memory_size=config['memory_size'],
+                    batch_size=config['batch_size'],
+                    memory=memory,
+                    fused_learn=config['fused_learn'],
+                    double_q=config['double_q'],
+                    mask_legal=config['mask_legal'],
+                    n_step=config['n_step'])
+    # an actor may be one batch ahead of the learner
+    limiter = ReplayRatioLimiter(config['replay_ratio'], config['learn_start'],
+                                 slack=config['replay_ratio'] * config['transfer_batch'])
+    server = ReplayServer(memory, limiter, config, config['host'], config['port'], config['weights_dtype'],
+                          RL.get_eval_params())
+    host, port = server.address[:2]
+    print("replay server listening on {}:{}".format(host, port))
+
+    ctx = mp.get_context('spawn')
+    actors = [ctx.Process(target=run_actor, args=('127.0.0.1' if host == '0.0.0.0' else host, port, config['seed']),
+                          daemon=True)
+              for _ in range(config['actors'])]
+    for actor in actors:
+        actor.start()
+
+    metrics = Metrics()
+    update = 0
+    try:
+        start = None
+        while update < config['updates'] and limiter.wait_for_learn():
+            if start is None:
+                start, stored_start = time.time(), server.transitions
+            RL.learn()
+            limiter.add_update()
+            update += 1
+            metrics.add('loss', RL.cost)
+            if update % config['sync_interval'] == 0:
+                server.publish(RL.get_eval_params())
+
+            for score in server.drain_scores():
+                metrics.add('score', score)
+            if update % config['report_interval'] == 0:
+                elapsed = time.time() - start
+                print("#" * 80)
+                print("update", update, ",cost:", RL.cost,
+                      ",updates/sec: {:.1f}".format(update / elapsed),
+                      ",transitions/sec: {:.1f}".format((server.transitions - stored_start) / elapsed),
+                      ",actors:", server.n_clients)
+                if metrics['score'].count:
+                    print("games:", metrics['score'].count, "avg-score: {}".format(metrics['score'].mean))
+    finally:
+        server.close()
+        for actor in actors:
+            actor.join(timeout=5)
+            if actor.is_alive():
+                actor.terminate()
+    return update
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    roles = parser.add_subparsers(dest='role', required=True)
+
+    learner = roles.add_parser('learner', help="replay server, learner and optional local actors")
+    learner.add_argument('--host', default='127.0.0.1', help="0.0.0.0 to accept remote actors")
+    learner.add_argument('--port', type=int, default=5555, help="0 picks a free port")
+    learner.add_argument('--actors', type=int, default=2, help="actor processes started on this machine")
+    learner.add_argument('--memory-size', type=int, default=100000)
+    learner.add_argument('--prioritized', action='store_true', help="prioritized replay instead of uniform")
+    learner.add_argument('--batch-size', type=int, default=512)
+    learner.add_argument('--learn-start', type=int, default=5000)
+    learner.add_argument('--replay-ratio', type=float, default=0.1,
+                         help="updates per received transition, actors wait when the learner is behind")
+    learner.add_argument('--updates', type=int, default=20000000)
+    learner.add_argument('--sync-interval', type=int, default=100,
+                         help="learner updates between weight snapshots / actor steps between weight requests")
+    learner.add_argument('--transfer-batch', type=int, default=256, help="transitions per message")
+    learner.add_argument('--weights-dtype', choices=DTYPES, default='float32', help="encoding of the snapshots")
+    learner.add_argument('--epsilon-start', type=float, nargs='+', default=[0.5],
+                         help="greedy probability of every actor at start, cycled over the actors")
+    learner.add_argument('--epsilon-max', type=float, default=0.99)
+    learner.add_argument('--epsilon-increment', type=float, default=1e-5)
+    learner.add_argument('--engine', choices=sorted(ENGINES), default='bitboard')
+    learner.add_argument('--mask-legal', action='store_true',
+                         help="choose and bootstrap only from moves that change the board")
+    learner.add_argument('--n-step', type=int, default=1,
+                         help="actors send n-step returns, the learner bootstraps with reward_decay ** n")
+    learner.add_argument('--fused-learn', action='store_true')
+    learner.add_argument('--double-q', action='store_true', help="Double-DQN target, needs --fused-learn")
+    learner.add_argument('--report-interval', type=int, default=100)
+    learner.add_argument('--seed', type=int, default=42)
+
+    actor = roles.add_parser('actor', help="actor processes playing for a remote learner")
+    actor.add_argument('--host', default='127.0.0.1')
+    actor.add_argument('--port', type=int, default=5555)
+    actor.add_argument('--actors', type=int, default=1, help="actor processes started on this machine")
+    actor.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.role == 'learner':
+        config = dict(vars(args), n_actions=4, n_features=16, reward_decay=0.95)
+        train_distributed(config)
+    else:
+        ctx = mp.get_context('spawn')
+        processes = [ctx.Process(target=run_actor, args=(args.host, args.port, args.seed)) for _ in range(args.actors)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
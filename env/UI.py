@@ -2,7 +2,10 @@
 from tkinter import *
 from tkinter import messagebox
 from math import log2
+import argparse
+import time
 from env import game
+from env.spectator import DEFAULT_NAME, SpectatorSlot
 
 KEYS_UP = ["Up"]
 KEYS_RIGHT = ["Right"]
@@ -42,13 +45,19 @@ GRID_COLUMNS = 37
 GRID_ROWS = 25
 GRID_UNIT = 20
 
+ACTION_NAMES = ["Up", "Right", "Down", "Left"]
+
 
 class UI:
     """
     Class UI
     This class implements the frontend using tkinter.
+    With spectate set to the name of a SpectatorSlot the window shows the
+    game of a training process instead of a playable one: the slot is
+    polled every poll_ms milliseconds on the Tk timer and only tiles that
+    changed are redrawn.
     """
-    def __init__(self):
+    def __init__(self, spectate=None, poll_ms=50, reconnect_after=5.):
 
         # set keys
         self.keys = [KEYS_UP, KEYS_RIGHT,
@@ -68,6 +77,19 @@ class UI:
         # create a game instance
         self.game = game.Game()
 
+        # spectator mode: state of the trainer's game and its slot
+        self.spectate = spectate
+        self.poll_ms = poll_ms
+        self.reconnect_after = reconnect_after
+        self.slot = None
+        self.slot_version = -1
+        self.last_change = time.monotonic()
+        self.spectated = None
+
+        # numbers and end-of-game state currently drawn, to skip unchanged tiles
+        self.shown_numbers = [[None] * 4 for _ in range(4)]
+        self.shown_finished = None
+
         # create window
         self.root = Tk()
         self.root.config(bg=self.bg)
@@ -96,6 +118,10 @@ class UI:
         # call function to close gracefully
         self.root.protocol("WM_DELETE_WINDOW", self.root_destroy)
 
+        if self.spectate is not None:
+            self.root.title("2048 - spectator")
+            self.root.after(self.poll_ms, self.poll)
+
     def destroy(self):
         self.root.destroy()
 
@@ -206,6 +232,8 @@ class UI:
         Afterwards fonts and content will be updated.
         """
         for i in range(4):
+            if self.listLabels[i] is self.labelNewGame and self.spectate is not None:
+                continue  # nothing to play
             self.listLabels[i].place(x=26 * self.unit,
                                      y=(6*i+1)*self.unit,
                                      width=9*self.unit,
@@ -289,7 +317,7 @@ class UI:
         This will only happen if game is not finished, otherwise the action
         can continue (because a finished game is not supposed to be critical).
         """
-        if not self.game.is_finished():
+        if self.spectate is None and not self.game.is_finished():
             # game is not finished yet
             answer = messagebox.askyesno(msgboxHeading,
                                          msgboxText)
@@ -304,6 +332,8 @@ class UI:
         """
         if self.confirm_action("Quit?", "Do you really want to quit?"):
             # self.game.writeHighScore()
+            if self.slot is not None:
+                self.slot.close()
             self.root.destroy()
 
     def new_game(self, event=None):
@@ -311,6 +341,8 @@ class UI:
         After confirming this action, old game will be saved and a new game
         will be created. Afterwards UI has to be updated.
         """
+        if self.spectate is not None:
+            return
         if self.confirm_action("New Game?",
                                "Do you really want to start a new game?"):
             # self.game.writeHighScore()
@@ -323,6 +355,8 @@ class UI:
         trigger a move.
         Also some additional keys for resize etc. can be processed here.
         """
+        if self.spectate is not None:
+            return
         for direction in range(4):
             if event.keysym in self.keys[direction]:
                 self.game.move(direction)
@@ -338,15 +372,53 @@ class UI:
         ix = int(log2(number))
         return self.colours[ix]
 
+    def poll(self):
+        """
+        This function reads the trainer's slot and shows its game when it
+        changed, then schedules itself again. It never waits for the
+        trainer; a slot without news for reconnect_after seconds is
+        attached again, e.g. after the trainer was restarted.
+        """
+        now = time.monotonic()
+        if self.slot is not None and now - self.last_change > self.reconnect_after:
+            self.slot.close()
+            self.slot = None
+        if self.slot is None:
+            self.slot = SpectatorSlot.attach(self.spectate)
+            self.slot_version = -1
+            self.last_change = now
+        if self.slot is not None:
+            self.slot_version, state = self.slot.read(self.slot_version)
+            if state is not None:
+                self.spectated = state
+                self.last_change = now
+                self.show()
+        if self.spectated is None:
+            self.labelHighScore["text"] = "Waiting for\ntrainer..."
+        self.root.after(self.poll_ms, self.poll)
+
     def show(self):
         """
-        This function updates content and appearence of fields.
+        This function updates content and appearence of fields that changed.
         Also current score and highscore are shown. Depending on current game
-        status (finished or not) the background colour is adjusted.
+        status (finished or not) the background colour is adjusted. A
+        spectator shows the trainer's game, episode and last action.
         """
+        if self.spectate is not None:
+            if self.spectated is None:
+                return
+            field, score, is_finished = self.spectated['field'], self.spectated['score'], self.spectated['done']
+            self.labelHighScore["text"] = "Episode {}\n{}".format(self.spectated['episode'],
+                                                                ACTION_NAMES[self.spectated['action']])
+        else:
+            field, score, is_finished = self.game.field, self.game.score, self.game.is_finished()
+
         for y in range(4):
             for x in range(4):
-                current_number = self.game.field[y][x]
+                current_number = field[y][x]
+                if current_number == self.shown_numbers[y][x]:
+                    continue
+                self.shown_numbers[y][x] = current_number
                 colours = self.get_colours(current_number)
                 self.field[y][x].config(fg=colours[1], bg=colours[2])
                 if current_number:
@@ -354,19 +426,28 @@ class UI:
                 else:
                     self.field[y][x]["text"] = ""
 
-        self.labelScore["text"] = "Score:\n" + str(self.game.score)
+        self.labelScore["text"] = "Score:\n" + str(score)
 
-        is_finished = self.game.is_finished()
-        if is_finished:
-            for element in [self.root] + self.listLabels:
-                element.config(bg=self.bgEndOfGame)
-        else:
-            for element in [self.root] + self.listLabels:
-                element.config(bg=self.bg)
+        if is_finished != self.shown_finished:
+            self.shown_finished = is_finished
+            if is_finished:
+                for element in [self.root] + self.listLabels:
+                    element.config(bg=self.bgEndOfGame)
+            else:
+                for element in [self.root] + self.listLabels:
+                    element.config(bg=self.bg)
 
-        self.root.update()
+        # a spectator draws from the Tk timer, the main loop redraws when idle
+        if self.spectate is None:
+            self.root.update()
 
 
 if __name__ == "__main__":
-    gui = UI()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spectate', nargs='?', const=DEFAULT_NAME,
+                        help="watch the game of run_this.py --spectate instead of playing")
+    parser.add_argument('--poll-ms', type=int, default=50, help="milliseconds between reads of the slot")
+    args = parser.parse_args()
+
+    gui = UI(args.spectate, args.poll_ms)
     gui.root.mainloop()
@@ -0,0 +1,317 @@
+# Bitboard backend for the 2048 game.
+# The 4x4 field is packed into one 64-bit integer of 4-bit tile exponents
+# (0 = empty, 1 = 2, 2 = 4, ... 15 = 32768). Tile (y, x) lives in the nibble
+# at bit offset 4 * (4 * y + x), so every row is one 16-bit chunk.
+from random import randint
+import numpy as np
+from env.observation import ObservationBuffers, board_exponents, encode, n_features
+
+ROW_MASK = 0xFFFF
+MAX_EXPONENT = 15
+
+# feature of every exponent, equal to format_state() of the tile value
+EXPONENT_FEATURES = [e / 10 for e in range(MAX_EXPONENT + 1)]
+
+
+def _reverse_row(row):
+    return ((row >> 12) & 0xF) | ((row >> 4) & 0xF0) | ((row << 4) & 0xF00) | ((row << 12) & 0xF000)
+
+
+def _unpack_col(row):
+    return (row & 0xF) | ((row & 0xF0) << 12) | ((row & 0xF00) << 24) | ((row & 0xF000) << 36)
+
+
+def _build_tables():
+    """
+    This function builds the 65536-entry lookup tables for every possible
+    row. A row is merged towards its first nibble exactly like Game merges a
+    row to the left. Column moves reuse the row result spread over the
+    column nibbles.
+    """
+    row_left = [0] * 65536
+    row_right = [0] * 65536
+    col_up = [0] * 65536
+    col_down = [0] * 65536
+    score_left = [0] * 65536
+    score_right = [0] * 65536
+    empty = [0] * 65536
+    for row in range(65536):
+        line = [(row >> (4 * i)) & 0xF for i in range(4)]
+        empty[row] = line.count(0)
+
+        # 1. get list without empty fields (just exponents)
+        values = [e for e in line if e != 0]
+        # 2. merge
+        score = 0
+        i = 0
+        while i < len(values) - 1:
+            if values[i] == values[i+1]:
+                values[i] = min(values[i] + 1, MAX_EXPONENT)
+                score += 1 << values[i]
+                del values[i+1]
+            i += 1
+        # 3. fill exponents in new row
+        result = 0
+        for i, e in enumerate(values):
+            result |= e << (4 * i)
+
+        rev_row = _reverse_row(row)
+        rev_result = _reverse_row(result)
+        row_left[row] = result
+        row_right[rev_row] = rev_result
+        col_up[row] = _unpack_col(result)
+        col_down[rev_row] = _unpack_col(rev_result)
+        score_left[row] = score
+        score_right[rev_row] = score
+    return row_left, row_right, col_up, col_down, score_left, score_right, empty
+
+
+ROW_LEFT, ROW_RIGHT, COL_UP, COL_DOWN, SCORE_LEFT, SCORE_RIGHT, ROW_EMPTY = _build_tables()
+# bit 0 when moving a row towards its first nibble changes it, bit 1 towards its last
+ROW_MOVES = [(ROW_LEFT[row] != row) | (ROW_RIGHT[row] != row) << 1 for row in range(65536)]
+# (N,E,S,W) mask of rows bits | column bits << 2, shared read-only arrays
+LEGAL_MASKS = [np.array([key & 4, key & 2, key & 8, key & 1], dtype=bool) for key in range(16)]
+for _mask in LEGAL_MASKS:
+    _mask.flags.writeable = False
+
+
+def transpose(board):
+    """
+    This function swaps tile (y, x) with tile (x, y).
+    """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def move_board(board, direction):
+    """
+    This function moves and merges the tiles of a board in passed direction
+    (0,1,2,3 = N,E,S,W) and returns the new board and the score gained.
+    No random tile is inserted.
+    """
+    new = 0
+    score = 0
+    if direction == 1 or direction == 3:
+        row_table, score_table = (ROW_RIGHT, SCORE_RIGHT) if direction == 1 else (ROW_LEFT, SCORE_LEFT)
+        for y in range(4):
+            row = (board >> (16 * y)) & ROW_MASK
+            new |= row_table[row] << (16 * y)
+            score += score_table[row]
+    else:
+        col_table, score_table = (COL_UP, SCORE_LEFT) if direction == 0 else (COL_DOWN, SCORE_RIGHT)
+        t = transpose(board)
+        for x in range(4):
+            col = (t >> (16 * x)) & ROW_MASK
+            new |= col_table[col] << (4 * x)
+            score += score_table[col]
+    return new, score
+
+
+def count_empty(board):
+    """
+    This function returns number of empty fields of a board.
+    """
+    return (ROW_EMPTY[board & ROW_MASK] + ROW_EMPTY[(board >> 16) & ROW_MASK] +
+            ROW_EMPTY[(board >> 32) & ROW_MASK] + ROW_EMPTY[(board >> 48) & ROW_MASK])
+
+
+def is_finished_board(board):
+    """
+    This function returns whether no more move can be done on a board.
+    A full board is finished when neither a horizontal nor a vertical merge
+    is possible, i.e. moving left and moving up both leave it unchanged.
+    """
+    if count_empty(board) != 0:
+        return False
+    return move_board(board, 3)[0] == board and move_board(board, 0)[0] == board
+
+
+def legal_actions_board(board):
+    """
+    This function returns a boolean mask of the directions (N,E,S,W) that
+    change a board: a row/column is movable when its table result differs.
+    The mask is one of the shared read-only LEGAL_MASKS.
+    """
+    t = transpose(board)
+    rows = cols = 0
+    for i in range(4):
+        rows |= ROW_MOVES[(board >> (16 * i)) & ROW_MASK]
+        cols |= ROW_MOVES[(t >> (16 * i)) & ROW_MASK]
+    return LEGAL_MASKS[rows | cols << 2]
+
+
+def board_to_field(board):
+    """
+    This function converts a board into the list-of-lists field used by Game.
+    """
+    field = []
+    for y in range(4):
+        row = []
+        for x in range(4):
+            e = (board >> (4 * (4 * y + x))) & 0xF
+            row.append(1 << e if e else 0)
+        field.append(row)
+    return field
+
+
+def field_to_board(field):
+    """
+    This function converts a list-of-lists field into a board.
+    """
+    board = 0
+    for y in range(4):
+        for x in range(4):
+            if field[y][x]:
+                board |= (int(field[y][x]).bit_length() - 1) << (4 * (4 * y + x))
+    return board
+
+
+def format_board(board, out=None, one_hot=False):
+    """
+    This function returns the observation of a board, equal to
+    format_state(np.array(field).flatten()), written into out when passed.
+    """
+    return encode(board_exponents(board, np.empty(16, dtype=np.uint64)), out, one_hot)
+
+
+class BitboardGame:
+    """
+    Class BitboardGame
+    Drop-in replacement of Game backed by a 64-bit board and precomputed
+    row/column tables. Random numbers are drawn exactly like Game does, so
+    both engines play move-for-move identical games for the same seed.
+    The exponent of a tile is capped at 15 (32768).
+    """
+    def __init__(self, one_hot=False, reuse_observations=False):
+        self.action_space = ['u', 'd', 'l', 'r']
+        self.n_actions = len(self.action_space)
+        # observations like Game, see Game.__init__
+        self.one_hot = one_hot
+        self.n_features = n_features(one_hot)
+        self.observation_buffers = ObservationBuffers(self.n_features) if reuse_observations else None
+        self._exponents = np.zeros(16, dtype=np.uint64)
+        # define probability of fours when random numbers appear (in percent)
+        self.probability4 = 10
+        # optional trajectory recorder, see trajectory.py
+        self.recorder = None
+        self._legal_board = None
+
+        # initialize a new game
+        self.new_game()
+
+    @property
+    def field(self):
+        return board_to_field(self.board)
+
+    def new_game(self):
+        # initialize/reset field and values
+        self.init_field()
+        self.init_values()
+
+    def init_values(self):
+        self.score = 0
+        self.round = 0
+
+    def init_field(self):
+        self.board = 0
+
+        self.insert_rand_num()
+        self.insert_rand_num()
+
+    def move(self, direction):
+        """
+        This function moves and merges the tiles in passed direction
+        (0,1,2,3 = N,E,S,W), then inserts a new number like Game.move.
+        """
+        self.board, score = move_board(self.board, direction)
+        self.score += score
+        self.spawn = self.insert_rand_num()
+        self.round += 1
+        return True
+
+    def insert_rand_num(self):
+        """
+        This function inserts 2 or 4 at the r-th empty field counted line by
+        line, consuming the random numbers in the same order as Game.
+        """
+        nulls = count_empty(self.board)
+        if nulls == 0:
+            return False
+        r = randint(1, nulls)
+        counter0 = 0
+        for i in range(16):
+            if (self.board >> (4 * i)) & 0xF == 0:
+                counter0 += 1
+                if r == counter0:
+                    if randint(1, 100) <= self.probability4:
+                        self.board |= 2 << (4 * i)
+                    else:
+                        self.board |= 1 << (4 * i)
+                    return i // 4, i % 4
+
+    def get_num_null_values(self):
+        return count_empty(self.board)
+
+    def is_finished(self):
+        return is_finished_board(self.board)
+
+    def legal_actions(self):
+        # cached per board, step() computes it anyway to decide whether the game is over
+        if self._legal_board != self.board:
+            self._legal = legal_actions_board(self.board)
+            self._legal_board = self.board
+        return self._legal
+
+    def observation(self):
+        out = self.observation_buffers.next() if self.observation_buffers is not None else None
+        return encode(board_exponents(self.board, self._exponents), out, self.one_hot)
+
+    def reset(self):
+        self.new_game()
+        if self.recorder is not None:
+            self.recorder.start_game(self)
+        return self.observation()
+
+    def step(self, action):
+        old_board = self.board
+        old_score = self.score
+        self.move(action)
+        done = not self.legal_actions().any()
+
+        # compute reward
+        change_score = self.score - old_score
+        if old_board != self.board:
+            if change_score == 0:
+                reward = 0
+            else:
+                reward = np.log2(change_score) / 8
+        else:
+            reward = -0.5
+
+        if done:
+            reward = -1
+
+        if self.recorder is not None:
+            self.recorder.record_step(self, action, reward, done)
+        return self.observation(), reward, done
+
+    def show(self):
+        """
+        This show function prints current game status and is only used
+        for debugging.
+        """
+        field = self.field
+        maxlen = len(str(max(max(row) for row in field)))
+        for row in field:
+            for number in row:
+                if number:
+                    print(" "*(maxlen-len(str(number)))+str(number), end=" ")
+                else:
+                    print(" "*maxlen, end=" ")
+            print("")
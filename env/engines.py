@@ -0,0 +1,5 @@
+# Game backends by name, both play identical games for the same random seed.
+from env.bitboard import BitboardGame
+from env.game import Game
+
+ENGINES = {'list': Game, 'bitboard': BitboardGame}
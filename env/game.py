@@ -1,16 +1,12 @@
 # This code is modified from: https://github.com/nikolockenvitz/2048/blob/master/2048.py
 from random import randint
 import numpy as np
+from env.observation import EXPONENTS, FEATURES, ObservationBuffers, encode, field_exponents, n_features
 
 
-def format_state(state):
-    res = []
-    for i in state:
-        if i == 0:
-            res.append(0)
-        else:
-            res.append(np.log2(i) / 10)
-    return np.array(res)
+def format_state(state, out=None):
+    # log2(tile) / 10 by table lookup
+    return np.take(FEATURES, [EXPONENTS[int(i)] for i in state], out=out)
 
 
 class Game:
@@ -27,12 +23,21 @@ class Game:
      - newGame()
      - isFinished()
     """
-    def __init__(self):
+    def __init__(self, one_hot=False, reuse_observations=False):
         self.action_space = ['u', 'd', 'l', 'r']
         self.n_actions = len(self.action_space)
-        self.n_features = 16
+        # observations: 16 features exponent / 10 or 16 cells x 16 one-hot channels
+        self.one_hot = one_hot
+        self.n_features = n_features(one_hot)
+        # with reuse_observations reset() and step() return one of two preallocated arrays
+        self.observation_buffers = ObservationBuffers(self.n_features) if reuse_observations else None
+        self._exponents = np.zeros(16, dtype=np.intp)
         # define probability of fours when random numbers appear (in percent)
         self.probability4 = 10
+        # optional trajectory recorder, see trajectory.py
+        self.recorder = None
+        # legal_actions() of the field it was computed for, step() fills it
+        self._legal_field = None
 
         # initialize a new game
         self.new_game()
@@ -76,7 +81,7 @@ class Game:
 
         # if self.field != new:
         self.field = new
-        self.insert_rand_num()
+        self.spawn = self.insert_rand_num()
         self.round += 1
         return True
         # return False
@@ -234,17 +239,48 @@ class Game:
             # some empty fields
             return False
 
+    def legal_actions(self):
+        """
+        This function returns a boolean mask of the directions (N,E,S,W) that
+        change the field: some tile has an empty field or an equal tile in
+        front of it. The mask is cached until the field changes, step()
+        computes it anyway to decide whether the game is over.
+        """
+        if self._legal_field == self.field:
+            return self._legal
+        up = right = down = left = False
+        field = self.field
+        for i in range(4):
+            for j in range(3):
+                # a before b in row i, c above d in column i
+                a, b = field[i][j], field[i][j + 1]
+                c, d = field[j][i], field[j + 1][i]
+                right = right or (a != 0 and (b == 0 or b == a))
+                left = left or (b != 0 and (a == 0 or a == b))
+                down = down or (c != 0 and (d == 0 or d == c))
+                up = up or (d != 0 and (c == 0 or c == d))
+        legal = np.array([up, right, down, left])
+        self._legal = legal
+        self._legal_field = [row[:] for row in self.field]
+        return legal
+
+    def observation(self):
+        out = self.observation_buffers.next() if self.observation_buffers is not None else None
+        return encode(field_exponents(self.field, self._exponents), out, self.one_hot)
+
     def reset(self):
         self.new_game()
-        return format_state(np.array(self.field).flatten())
+        if self.recorder is not None:
+            self.recorder.start_game(self)
+        return self.observation()
 
     def step(self, action):
         old_field = self.field
         old_score = self.score
         self.move(action)
         new_score = self.score
-        done = self.is_finished()
-        s_ = np.array(self.field).flatten()
+        # the game is over when no move changes the field, the mask stays cached for the next choice
+        done = not self.legal_actions().any()
 
         # compute reward
         change_score = new_score - old_score
@@ -259,7 +295,9 @@ class Game:
         if done:
             reward = -1
 
-        return format_state(s_), reward, done
+        if self.recorder is not None:
+            self.recorder.record_step(self, action, reward, done)
+        return self.observation(), reward, done
 
     def show(self):
         """
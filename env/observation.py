@@ -0,0 +1,80 @@
+# Observation encoding shared by the engines: lookup tables from tile
+# exponents to features and encoders that write into preallocated buffers.
+import numpy as np
+
+# Game tiles go up to 2^17, the bitboard caps exponents at 15
+MAX_EXPONENT = 17
+# exponent -> feature, equal to np.log2(value) / 10 of the original format_state
+FEATURES = np.arange(MAX_EXPONENT + 1) / 10
+# exponent -> 16-channel one-hot row, exponents above 15 share the last channel
+ONE_HOT = np.eye(MAX_EXPONENT + 1, 16)
+ONE_HOT[16:, 15] = 1
+# tile value -> exponent
+EXPONENTS = {0: 0}
+EXPONENTS.update({2 ** e: e for e in range(1, MAX_EXPONENT + 1)})
+SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+
+def n_features(one_hot=False):
+    return 256 if one_hot else 16
+
+
+def encode(exponents, out=None, one_hot=False):
+    """
+    This function encodes 16 tile exponents as 16 features (exponent / 10)
+    or, with one_hot, as 16 cells x 16 channels, into out when passed.
+    """
+    if one_hot:
+        if out is None:
+            out = np.empty(256)
+        np.take(ONE_HOT, exponents, axis=0, out=out.reshape(16, 16))
+        return out
+    return np.take(FEATURES, exponents, out=out)
+
+
+def field_exponents(field, out):
+    """
+    This function writes the exponents of a list-of-lists field into out.
+    """
+    i = 0
+    for row in field:
+        for value in row:
+            out[i] = EXPONENTS[value]
+            i += 1
+    return out
+
+
+def board_exponents(board, out):
+    """
+    This function writes the exponents of a 64-bit board into the uint64
+    array out.
+    """
+    np.right_shift(np.uint64(board), SHIFTS, out=out)
+    return np.bitwise_and(out, np.uint64(0xF), out=out)
+
+
+def to_exponents(observations):
+    """
+    This function returns the (N, 16) uint8 exponents of a batch of
+    observations of either encoding.
+    """
+    observations = np.asarray(observations)
+    if observations.shape[-1] == 256:
+        return observations.reshape(-1, 16, 16).argmax(axis=2).astype(np.uint8)
+    return np.rint(observations.reshape(-1, 16) * 10).astype(np.uint8)
+
+
+class ObservationBuffers:
+    """
+    Class ObservationBuffers
+    Two preallocated observation arrays handed out in turn, so that the
+    observation and the next observation of a step never share memory.
+    An observation stays valid until the second next call of next().
+    """
+    def __init__(self, n_features):
+        self.buffers = [np.zeros(n_features), np.zeros(n_features)]
+        self.index = 0
+
+    def next(self):
+        self.index ^= 1
+        return self.buffers[self.index]
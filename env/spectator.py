@@ -0,0 +1,86 @@
+# Live view into training: the trainer publishes its current game into a
+# small shared-memory slot at a throttled rate, env/UI.py --spectate polls it.
+#     python run_this.py --spectate
+#     python -m env.UI --spectate
+from multiprocessing import resource_tracker, shared_memory
+import time
+import numpy as np
+
+DEFAULT_NAME = 'rl2048_spectator'
+# version, score, episode, step (int64), 16 tiles (int32), action, done (int8)
+SLOT_SIZE = 4 * 8 + 16 * 4 + 2
+
+
+class SpectatorSlot:
+    """
+    Class SpectatorSlot
+    One game state in a named shared-memory block, guarded by a sequence
+    counter like actor_pool.SharedWeights: the counter is odd while the
+    trainer writes. The trainer creates the slot (create=True) and calls
+    publish() every step, which returns at once unless `interval` seconds
+    passed or the game is over. Spectators attach by name and read() without
+    ever waiting for the trainer.
+    """
+    def __init__(self, name=DEFAULT_NAME, create=False, interval=0.05):
+        self.interval = interval
+        self.owner = create
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=SLOT_SIZE)
+            except FileExistsError:  # left over by a killed trainer
+                self.shm = shared_memory.SharedMemory(name=name)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # the resource tracker would unlink the trainer's slot when the spectator exits
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.name = name
+        self.header = np.ndarray((4,), dtype=np.int64, buffer=self.shm.buf)
+        self.tiles = np.ndarray((16,), dtype=np.int32, buffer=self.shm.buf, offset=32)
+        self.flags = np.ndarray((2,), dtype=np.int8, buffer=self.shm.buf, offset=96)
+        if create:
+            self.header[0] = 0
+        self.last_publish = 0.
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        """
+        This function returns the slot of a running trainer or None.
+        """
+        try:
+            return cls(name)
+        except FileNotFoundError:
+            return None
+
+    def publish(self, env, action, episode, step, done=False):
+        now = time.monotonic()
+        if not done and now - self.last_publish < self.interval:
+            return False
+        self.last_publish = now
+        self.header[0] += 1
+        self.header[1:] = env.score, episode, step
+        self.tiles[:] = np.ravel(env.field)
+        self.flags[:] = action, done
+        self.header[0] += 1
+        return True
+
+    def read(self, last_version=-1):
+        """
+        This function returns (version, state) or (last_version, None) when
+        nothing new was published or the trainer is writing right now. state
+        is a dict with field (4x4 list), score, episode, step, action, done.
+        """
+        version = int(self.header[0])
+        if version == last_version or version % 2 == 1:
+            return last_version, None
+        header, tiles, flags = self.header.copy(), self.tiles.copy(), self.flags.copy()
+        if int(self.header[0]) != version:
+            return last_version, None
+        return version, {'field': tiles.reshape(4, 4).tolist(), 'score': int(header[1]),
+                         'episode': int(header[2]), 'step': int(header[3]),
+                         'action': int(flags[0]), 'done': bool(flags[1])}
+
+    def close(self):
+        self.header = self.tiles = self.flags = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,158 @@
+# Vectorized 2048 environment stepping many boards per NumPy call.
+import time
+import numpy as np
+from env import bitboard
+
+# cells of the four lines of every direction (0,1,2,3 = N,E,S,W), ordered so
+# that tiles are pushed towards the first cell of a line
+LINES = np.array([[[x, 4 + x, 8 + x, 12 + x] for x in range(4)],
+                  [[4 * y + 3, 4 * y + 2, 4 * y + 1, 4 * y] for y in range(4)],
+                  [[12 + x, 8 + x, 4 + x, x] for x in range(4)],
+                  [[4 * y, 4 * y + 1, 4 * y + 2, 4 * y + 3] for y in range(4)]]).reshape(4, 16)
+
+# packed line -> merged line exponents / score gained, shared with the bitboard tables
+_ROW_LEFT = np.array(bitboard.ROW_LEFT, dtype=np.int64)
+LINE_RESULT = ((_ROW_LEFT[:, np.newaxis] >> (4 * np.arange(4))) & 0xF).astype(np.uint8)
+LINE_SCORE = np.array(bitboard.SCORE_LEFT, dtype=np.int64)
+LINE_WEIGHTS = np.array([1, 16, 256, 4096], dtype=np.int64)
+
+# exponent -> observation feature, equal to format_state()
+FEATURES = np.array(bitboard.EXPONENT_FEATURES)
+
+
+def legal_actions(boards):
+    """
+    This function returns the (N, 4) boolean mask of the directions that
+    change each of the (N, 16) exponent boards.
+    """
+    legal = np.zeros((len(boards), 4), dtype=bool)
+    for direction in range(4):
+        lines = boards[:, LINES[direction]].reshape(-1, 4, 4)
+        legal[:, direction] = (LINE_RESULT[lines.dot(LINE_WEIGHTS)] != lines).any(axis=(1, 2))
+    return legal
+
+
+class VecGame:
+    """
+    Class VecGame
+    Holds N boards as a (N, 16) array of tile exponents and plays all of them
+    at once. step() applies moves, merges, random tiles, rewards and done
+    flags exactly like Game.step for every board and resets finished boards
+    automatically. The observations, the score and the final observation of
+    every board finished in the last step are kept in
+    final_observations / final_scores (ordered like np.flatnonzero(dones)).
+    """
+    def __init__(self, n_boards, seed=None):
+        self.action_space = ['u', 'd', 'l', 'r']
+        self.n_actions = len(self.action_space)
+        self.n_features = 16
+        self.n_boards = n_boards
+        # define probability of fours when random numbers appear
+        self.probability4 = 0.1
+        self.rng = np.random.RandomState(seed)
+
+        self.boards = np.zeros((n_boards, 16), dtype=np.uint8)
+        self.scores = np.zeros(n_boards, dtype=np.int64)
+        self.rounds = np.zeros(n_boards, dtype=np.int64)
+        self.final_observations = np.zeros((0, 16))
+        self.final_scores = np.zeros(0, dtype=np.int64)
+        self._rows = np.arange(n_boards)
+        self.reset()
+
+    def _insert_rand_num(self, rows):
+        """
+        This function inserts 2 or 4 at a random empty field of the passed
+        boards. Boards without empty field are left unchanged.
+        """
+        empty = self.boards[rows] == 0
+        nulls = empty.sum(axis=1)
+        has_null = nulls > 0
+        rows, empty, nulls = rows[has_null], empty[has_null], nulls[has_null]
+        r = (self.rng.random_sample(len(rows)) * nulls).astype(np.int64)
+        cell = (np.cumsum(empty, axis=1) > r[:, np.newaxis]).argmax(axis=1)
+        self.boards[rows, cell] = np.where(self.rng.random_sample(len(rows)) < self.probability4, 2, 1)
+
+    def _reset_boards(self, rows):
+        self.boards[rows] = 0
+        self.scores[rows] = 0
+        self.rounds[rows] = 0
+        self._insert_rand_num(rows)
+        self._insert_rand_num(rows)
+
+    def observation(self):
+        return FEATURES[self.boards]
+
+    def is_finished(self):
+        """
+        This function returns the done flag of every board: no empty field and
+        no two equal neighbours in a row or a column.
+        """
+        grid = self.boards.reshape(-1, 4, 4)
+        merge_h = (grid[:, :, :-1] == grid[:, :, 1:]).any(axis=(1, 2))
+        merge_v = (grid[:, :-1, :] == grid[:, 1:, :]).any(axis=(1, 2))
+        return (self.boards != 0).all(axis=1) & ~merge_h & ~merge_v
+
+    def legal_actions(self):
+        return legal_actions(self.boards)
+
+    def reset(self):
+        self._reset_boards(self._rows)
+        return self.observation()
+
+    def move(self, actions):
+        """
+        This function moves and merges the tiles of every board in its own
+        direction and returns the score gained by every board.
+        """
+        cells = LINES[actions]
+        lines = np.take_along_axis(self.boards, cells, axis=1).reshape(-1, 4, 4)
+        packed = lines.dot(LINE_WEIGHTS)
+        np.put_along_axis(self.boards, cells, LINE_RESULT[packed].reshape(-1, 16), axis=1)
+        return LINE_SCORE[packed].sum(axis=1)
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64)
+        old_boards = self.boards.copy()
+        change_score = self.move(actions)
+        self._insert_rand_num(self._rows)
+        self.scores += change_score
+        self.rounds += 1
+        dones = self.is_finished()
+
+        # compute reward
+        changed = (self.boards != old_boards).any(axis=1)
+        rewards = np.log2(np.maximum(change_score, 1)) / 8
+        rewards[~changed] = -0.5
+        rewards[dones] = -1
+
+        observations = self.observation()
+        if dones.any():
+            finished = self._rows[dones]
+            self.final_observations = observations[finished]
+            self.final_scores = self.scores[finished]
+            self._reset_boards(finished)
+            observations[finished] = FEATURES[self.boards[finished]]
+        else:
+            self.final_observations = observations[:0]
+            self.final_scores = self.scores[:0]
+        return observations, rewards, dones
+
+
+def benchmark(n_boards=4096, n_steps=200, seed=0):
+    """
+    This function steps n_boards boards with random actions for n_steps steps
+    and returns the throughput in board-steps per second.
+    """
+    env = VecGame(n_boards, seed=seed)
+    rng = np.random.RandomState(seed)
+    actions = rng.randint(0, env.n_actions, size=(n_steps, n_boards))
+    env.step(actions[0])  # warm up
+    start = time.time()
+    for t in range(n_steps):
+        env.step(actions[t])
+    return n_boards * n_steps / (time.time() - start)
+
+
+if __name__ == "__main__":
+    for n in [256, 1024, 4096, 16384]:
+        print("N={:6d}: {:12.0f} board-steps/sec".format(n, benchmark(n)))
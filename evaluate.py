@@ -0,0 +1,177 @@
+"""
+Evaluation of a trained policy: N greedy games played by a process pool of
+NumPy copies of the eval_net, game i seeded with seed + i.
+    python evaluate.py CHECKPOINT_DIR_OR_WEIGHTS.npz --games 100 --workers 4
+Evaluator runs the same games asynchronously, so train_2048 can evaluate
+its current weights periodically without waiting for the games.
+"""
+from collections import Counter
+import multiprocessing as mp
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import numpy as np
+from env.engines import ENGINES
+from env.observation import n_features
+from numpy_policy import NumpyDuelingNet, load_weights, save_weights
+
+
+def load_policy(path):
+    """
+    This function returns the eval_net weights of a .npz written by
+    export_weights or of a checkpoint directory written by checkpoint.py.
+    """
+    if path.endswith('.npz'):
+        return load_weights(path)
+    import tensorflow as tf
+    from RL_brain import DuelingDQN
+    from checkpoint import load_args
+
+    args = load_args(path)
+    tf.reset_default_graph()
+    RL = DuelingDQN(4, n_features(args.get('one_hot', False)), memory_size=1,
+                    fused_learn=args.get('fused_learn', False), double_q=args.get('double_q', False))
+    RL.saver.restore(RL.sess, os.path.join(path, 'model.ckpt'))
+    values = RL.get_eval_params()
+    RL.sess.close()
+    return values
+
+
+def weights_one_hot(values):
+    # conv1_w is [1, 1, channels, 64], one channel per exponent for one-hot observations
+    return np.shape(values[0])[-2] > 1
+
+
+def play_greedy(net, env, seed, mask_legal=True, max_moves=100000):
+    """
+    This function plays one greedy game and returns (seed, score, max tile,
+    moves). Without mask_legal a greedy policy may repeat a move that does
+    not change the board, max_moves ends such games.
+    """
+    random.seed(seed)
+    observation = env.reset()
+    for moves in range(1, max_moves + 1):
+        action = net.choose_action(observation, env.legal_actions() if mask_legal else None)
+        observation, _, done = env.step(action)
+        if done:
+            break
+    return seed, env.score, max(max(row) for row in env.field), moves
+
+
+_worker = {}
+
+
+def _play_game(task):
+    # pool worker, keeps the net of the last weights file
+    path, seed, engine, one_hot, mask_legal, max_moves = task
+    if _worker.get('path') != path:
+        _worker['net'] = NumpyDuelingNet.load(path)
+        _worker['env'] = ENGINES[engine](one_hot=one_hot)
+        _worker['path'] = path
+    return play_greedy(_worker['net'], _worker['env'], seed, mask_legal, max_moves)
+
+
+def summarize(results, elapsed):
+    seeds, scores, tiles, moves = zip(*results)
+    return {'games': len(scores),
+            'mean_score': float(np.mean(scores)),
+            'median_score': float(np.median(scores)),
+            'min_score': int(min(scores)),
+            'max_score': int(max(scores)),
+            'max_tiles': dict(sorted(Counter(tiles).items())),
+            'mean_moves': float(np.mean(moves)),
+            'median_moves': float(np.median(moves)),
+            'games_per_sec': len(scores) / elapsed}
+
+
+def print_summary(stats):
+    print("score: mean {:.1f}, median {:.1f}, min {}, max {}".format(
+        stats['mean_score'], stats['median_score'], stats['min_score'], stats['max_score']))
+    print("moves: mean {:.1f}, median {:.1f}, games/sec: {:.2f}".format(
+        stats['mean_moves'], stats['median_moves'], stats['games_per_sec']))
+    print("max tile distribution:")
+    for tile, count in stats['max_tiles'].items():
+        print("{:6d}: {:4d} ({:5.1f}%)".format(tile, count, 100. * count / stats['games']))
+
+
+class Evaluator:
+    """
+    Class Evaluator
+    Plays n_games greedy games with given weights in a pool of worker
+    processes. submit() writes the weights to a temporary file and returns
+    at once, poll() returns (tag, stats) when the games are done. Only one
+    evaluation runs at a time; every `every` episodes one is due.
+    """
+    def __init__(self, n_games=100, workers=2, every=1000, seed=0, engine='bitboard', mask_legal=True,
+                 max_moves=100000, one_hot=False):
+        self.n_games = n_games
+        self.every = every
+        self.seed = seed
+        self.engine = engine
+        # observations of the trained net, see env/observation.py
+        self.one_hot = one_hot
+        self.mask_legal = mask_legal
+        self.max_moves = max_moves
+        self.pool = mp.get_context('spawn').Pool(workers)
+        self.tmp_dir = tempfile.mkdtemp(prefix='evaluate_')
+        self.submitted = 0
+        self.pending = None
+
+    def due(self, episode):
+        return self.pending is None and self.every > 0 and episode % self.every == 0
+
+    def submit(self, values, tag=None):
+        if self.pending is not None:
+            return False
+        path = os.path.join(self.tmp_dir, 'weights_{}.npz'.format(self.submitted))
+        save_weights(path, values)
+        self.submitted += 1
+        tasks = [(path, self.seed + i, self.engine, self.one_hot, self.mask_legal, self.max_moves)
+                 for i in range(self.n_games)]
+        self.pending = (tag, path, time.time(), self.pool.map_async(_play_game, tasks))
+        return True
+
+    def poll(self, wait=False):
+        if self.pending is None:
+            return None
+        tag, path, start, result = self.pending
+        if not wait and not result.ready():
+            return None
+        results = result.get()
+        self.pending = None
+        os.remove(path)
+        return tag, summarize(results, time.time() - start)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def evaluate(values, n_games=100, workers=2, seed=0, engine='bitboard', mask_legal=True, max_moves=100000):
+    evaluator = Evaluator(n_games, workers, seed=seed, engine=engine, mask_legal=mask_legal, max_moves=max_moves,
+                          one_hot=weights_one_hot(values))
+    try:
+        evaluator.submit(values)
+        return evaluator.poll(wait=True)[1]
+    finally:
+        evaluator.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help="checkpoint directory or weights .npz")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=mp.cpu_count())
+    parser.add_argument('--seed', type=int, default=0, help="game i is played with seed + i")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='bitboard')
+    parser.add_argument('--no-mask', action='store_true', help="let the policy choose moves that change nothing")
+    parser.add_argument('--max-moves', type=int, default=100000)
+    args = parser.parse_args()
+
+    stats = evaluate(load_policy(args.path), args.games, args.workers, args.seed, args.engine,
+                     not args.no_mask, args.max_moves)
+    print_summary(stats)
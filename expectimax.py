@@ -0,0 +1,203 @@
+"""
+Expectimax player on the bitboard engine, a non-learned baseline for the DQN.
+    python expectimax.py --games 20
+"""
+from collections import Counter, OrderedDict
+import argparse
+import random
+import time
+import numpy as np
+from env.bitboard import BitboardGame, ROW_MASK, count_empty, move_board, transpose
+
+# heuristic weights of every row/column, from nneonneo/2048-ai
+SCORE_LOST_PENALTY = 200000.
+SCORE_MONOTONICITY_POWER = 4.
+SCORE_MONOTONICITY_WEIGHT = 47.
+SCORE_SUM_POWER = 3.5
+SCORE_SUM_WEIGHT = 11.
+SCORE_MERGES_WEIGHT = 700.
+SCORE_EMPTY_WEIGHT = 270.
+
+
+def _build_heuristic_table():
+    table = [0.] * 65536
+    for row in range(65536):
+        line = [(row >> (4 * i)) & 0xF for i in range(4)]
+        total = 0.
+        empty = 0
+        merges = 0
+        prev = 0
+        counter = 0
+        for rank in line:
+            total += rank ** SCORE_SUM_POWER
+            if rank == 0:
+                empty += 1
+            else:
+                if prev == rank:
+                    counter += 1
+                elif counter > 0:
+                    merges += 1 + counter
+                    counter = 0
+                prev = rank
+        if counter > 0:
+            merges += 1 + counter
+
+        monotonicity_left = 0.
+        monotonicity_right = 0.
+        for i in range(1, 4):
+            a = line[i-1] ** SCORE_MONOTONICITY_POWER * SCORE_MONOTONICITY_WEIGHT
+            b = line[i] ** SCORE_MONOTONICITY_POWER * SCORE_MONOTONICITY_WEIGHT
+            if line[i-1] > line[i]:
+                monotonicity_left += a - b
+            else:
+                monotonicity_right += b - a
+
+        table[row] = (SCORE_LOST_PENALTY + SCORE_EMPTY_WEIGHT * empty + SCORE_MERGES_WEIGHT * merges -
+                      min(monotonicity_left, monotonicity_right) - SCORE_SUM_WEIGHT * total)
+    return table
+
+
+HEURISTIC = _build_heuristic_table()
+
+
+def heuristic(board):
+    t = transpose(board)
+    return (HEURISTIC[board & ROW_MASK] + HEURISTIC[(board >> 16) & ROW_MASK] +
+            HEURISTIC[(board >> 32) & ROW_MASK] + HEURISTIC[(board >> 48) & ROW_MASK] +
+            HEURISTIC[t & ROW_MASK] + HEURISTIC[(t >> 16) & ROW_MASK] +
+            HEURISTIC[(t >> 32) & ROW_MASK] + HEURISTIC[(t >> 48) & ROW_MASK])
+
+
+def max_tile(board):
+    return 1 << max((board >> (4 * i)) & 0xF for i in range(16))
+
+
+class Expectimax:
+    """
+    Class Expectimax
+    Depth-limited expectimax search over moves (max nodes) and random tiles
+    (chance nodes). Chance nodes whose path probability falls below
+    min_probability are scored by the heuristic instead of expanded. The
+    search depth is max_depth, reduced by one for every empty_step empty
+    fields: few empty fields mean few chance branches, so the search can go
+    deeper where the game is decided. Chance node values are kept in a
+    transposition table of at most table_size boards; the oldest entry is
+    evicted first.
+    """
+    def __init__(self, max_depth=2, empty_step=6, min_probability=1e-3, table_size=1000000):
+        self.max_depth = max_depth
+        self.empty_step = empty_step
+        self.min_probability = min_probability
+        self.table_size = table_size
+        self.table = OrderedDict()
+        self.nodes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.search_time = 0.
+
+    def depth_for(self, board):
+        return max(1, self.max_depth - count_empty(board) // self.empty_step)
+
+    def choose_action(self, board):
+        """
+        This function returns the best move (0,1,2,3 = N,E,S,W) of a board or
+        None when no move changes it.
+        """
+        start = time.time()
+        depth = self.depth_for(board)
+        best_action, best_value = None, -1.
+        for action in range(4):
+            new, _ = move_board(board, action)
+            if new == board:
+                continue
+            value = self.chance_node(new, depth, 1.)
+            if value > best_value:
+                best_action, best_value = action, value
+        self.search_time += time.time() - start
+        return best_action
+
+    def chance_node(self, board, depth, probability):
+        self.nodes += 1
+        if depth <= 0 or probability < self.min_probability:
+            return heuristic(board)
+
+        self.lookups += 1
+        entry = self.table.get(board)
+        if entry is not None and entry[0] >= depth:
+            self.hits += 1
+            return entry[1]
+
+        empty = count_empty(board)
+        probability /= empty
+        total = 0.
+        for i in range(16):
+            if (board >> (4 * i)) & 0xF == 0:
+                total += 0.9 * self.max_node(board | (1 << (4 * i)), depth, probability * 0.9)
+                total += 0.1 * self.max_node(board | (2 << (4 * i)), depth, probability * 0.1)
+        value = total / empty
+
+        self.table[board] = (depth, value)
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+        return value
+
+    def max_node(self, board, depth, probability):
+        self.nodes += 1
+        best = 0.  # no move left: lost
+        for action in range(4):
+            new, _ = move_board(board, action)
+            if new != board:
+                best = max(best, self.chance_node(new, depth - 1, probability))
+        return best
+
+    def stats(self):
+        return {'nodes': self.nodes,
+                'nodes_per_sec': self.nodes / self.search_time if self.search_time else 0.,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.,
+                'table_size': len(self.table)}
+
+
+def play_game(agent, env):
+    env.reset()
+    while True:
+        action = agent.choose_action(env.board)
+        if action is None:
+            break
+        env.move(action)
+        if env.is_finished():
+            break
+    return env.score, max_tile(env.board), env.round
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-depth', type=int, default=2, help="search depth of boards with few empty fields")
+    parser.add_argument('--min-probability', type=float, default=1e-3)
+    parser.add_argument('--table-size', type=int, default=1000000)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    agent = Expectimax(max_depth=args.max_depth, min_probability=args.min_probability,
+                       table_size=args.table_size)
+    env = BitboardGame()
+    scores = []
+    tiles = Counter()
+    for game in range(args.games):
+        score, tile, rounds = play_game(agent, env)
+        scores.append(score)
+        tiles[tile] += 1
+        stats = agent.stats()
+        print("game", game, ",score:", score, ",max-tile:", tile, ",moves:", rounds,
+              ",nodes/sec: {:.0f}".format(stats['nodes_per_sec']), ",hit-rate: {:.3f}".format(stats['hit_rate']))
+
+    print("#" * 80)
+    print("score: mean {:.1f}, median {:.1f}, min {}, max {}".format(
+        np.mean(scores), np.median(scores), min(scores), max(scores)))
+    print("max tile distribution:")
+    for tile in sorted(tiles):
+        print("{:6d}: {:4d} ({:5.1f}%)".format(tile, tiles[tile], 100. * tiles[tile] / args.games))
+    stats = agent.stats()
+    print("nodes: {}, nodes/sec: {:.0f}, table hit rate: {:.3f}, table size: {}".format(
+        stats['nodes'], stats['nodes_per_sec'], stats['hit_rate'], stats['table_size']))
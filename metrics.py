@@ -0,0 +1,223 @@
+"""
+Training metrics in constant memory, however long a run takes:
+ - Metric         rolling mean and percentiles over the last `window`
+                  values, all-time count and a downsampled history
+ - QuantileSketch log-spaced bucket counts with a relative accuracy
+ - History        at most `size` points, halved by averaging pairs when full
+ - MetricsSink    buffered rows appended to a .jsonl or .csv file
+"""
+import csv
+import json
+import math
+import os
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Class QuantileSketch
+    Counts values in buckets (g^(k-1), g^k] with g = (1+accuracy)/(1-accuracy),
+    so every quantile is returned within the relative accuracy. Negative
+    values are counted by magnitude in a mirrored set of buckets. Values
+    within min_value of 0 share the middle bucket and are returned as 0,
+    magnitudes above max_value the outermost ones. Values can be removed
+    again, which makes the sketch usable over a sliding window.
+    """
+    def __init__(self, accuracy=0.01, min_value=1e-6, max_value=1e8):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.offset = int(math.floor(math.log(min_value) / self.log_gamma))
+        # buckets per sign, counts[zero] holds the values around 0
+        self.zero = int(math.ceil(math.log(max_value) / self.log_gamma)) - self.offset + 1
+        self.counts = np.zeros(2 * self.zero + 1, dtype=np.int64)
+        self.count = 0
+
+    def _bucket(self, value):
+        magnitude = abs(value)
+        if magnitude <= self.min_value:
+            return self.zero
+        k = min(int(math.ceil(math.log(magnitude) / self.log_gamma)) - self.offset, self.zero)
+        return self.zero + k if value > 0 else self.zero - k
+
+    def add(self, value):
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+
+    def remove(self, value):
+        self.counts[self._bucket(value)] -= 1
+        self.count -= 1
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float('nan')
+        i = int(np.searchsorted(np.cumsum(self.counts), q * (self.count - 1), side='right'))
+        k = i - self.zero
+        if k == 0:
+            return 0.
+        return math.copysign(2 * self.gamma ** (abs(k) + self.offset) / (self.gamma + 1), k)
+
+
+class History:
+    """
+    Class History
+    Downsampled history of a metric in at most `size` points: every point
+    is the mean of `stride` consecutive values and when all points are
+    used, pairs of points are averaged and the stride doubles.
+    """
+    def __init__(self, size=1000):
+        self.size = size - size % 2
+        self.points = np.zeros(self.size)
+        self.n = 0
+        self.stride = 1
+        self.count = 0
+        self._sum = 0.
+        self._n_sum = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, value):
+        self.count += 1
+        self._sum += value
+        self._n_sum += 1
+        if self._n_sum == self.stride:
+            self.points[self.n] = self._sum / self.stride
+            self.n += 1
+            self._sum = 0.
+            self._n_sum = 0
+            if self.n == self.size:
+                half = self.size // 2
+                self.points[:half] = self.points.reshape(half, 2).mean(axis=1)
+                self.n = half
+                self.stride *= 2
+
+    def values(self):
+        """
+        This function returns (index of the last value of every point, points).
+        """
+        return np.arange(1, self.n + 1) * self.stride, self.points[:self.n].copy()
+
+
+class Metric:
+    """
+    Class Metric
+    Rolling mean and quantiles over the last `window` values (ring buffer
+    with a running sum and a QuantileSketch), the last value, the number
+    of values and a History of all of them.
+    """
+    def __init__(self, window=1500, history_size=1000):
+        self.values = np.zeros(window)
+        self.index = 0
+        self.n = 0
+        self.sum = 0.
+        self.sketch = QuantileSketch()
+        self.history = History(history_size)
+        self.last = float('nan')
+
+    @property
+    def count(self):
+        return self.history.count
+
+    def add(self, value):
+        value = float(value)
+        if self.n == len(self.values):
+            old = self.values[self.index]
+            self.sum -= old
+            self.sketch.remove(old)
+        else:
+            self.n += 1
+        self.values[self.index] = value
+        self.sum += value
+        self.sketch.add(value)
+        self.index += 1
+        if self.index == len(self.values):
+            self.index = 0
+            self.sum = float(self.values.sum())  # no drift of the running sum
+        self.history.append(value)
+        self.last = value
+
+    @property
+    def mean(self):
+        return self.sum / self.n if self.n else float('nan')
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+
+class MetricsSink:
+    """
+    Class MetricsSink
+    Appends rows (dicts) to a .csv file (columns of the first row) or a
+    JSON lines file otherwise, in batches of flush_every rows.
+    """
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self.csv = path.endswith('.csv')
+        self.rows = []
+        self.fieldnames = None
+        if self.csv and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                self.fieldnames = next(csv.reader(f))
+        self.file = open(path, 'a', newline='')
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.csv:
+            if self.fieldnames is None:
+                self.fieldnames = list(self.rows[0])
+                csv.writer(self.file).writerow(self.fieldnames)
+            csv.DictWriter(self.file, self.fieldnames, extrasaction='ignore').writerows(self.rows)
+        else:
+            self.file.write(''.join(json.dumps(row) + '\n' for row in self.rows))
+        self.file.flush()
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __getstate__(self):
+        # pickled with the training state of a checkpoint, reopens the file on load
+        self.flush()
+        return {'path': self.path, 'flush_every': self.flush_every}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['flush_every'])
+
+
+class Metrics:
+    """
+    Class Metrics
+    Named Metric objects created on first use; log() writes a row to the
+    sink when there is one.
+    """
+    def __init__(self, window=1500, history_size=1000, sink=None):
+        self.window = window
+        self.history_size = history_size
+        self.sink = sink
+        self.metrics = {}
+
+    def __getitem__(self, name):
+        if name not in self.metrics:
+            self.metrics[name] = Metric(self.window, self.history_size)
+        return self.metrics[name]
+
+    def add(self, name, value):
+        self[name].add(value)
+
+    def log(self, **row):
+        if self.sink is not None:
+            self.sink.write({key: float(value) if isinstance(value, np.floating) else value
+                             for key, value in row.items()})
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
@@ -0,0 +1,136 @@
+"""
+N-tuple network agent for 2048, an alternative to DuelingDQN that needs no
+TensorFlow session. The value of an afterstate (the board after a move,
+before the random tile) is the sum of float32 weights looked up by the tile
+exponents of a few cell tuples, every tuple in its 8 symmetric positions
+sharing one table. Actions maximize score gained + value of the afterstate,
+the tables learn with afterstate TD(0) on the game score.
+    python run_this.py --agent ntuple --ntuple-weights ntuple.npz
+"""
+from collections import deque
+import numpy as np
+from env.observation import to_exponents
+from env.vec_game import LINES, LINE_RESULT, LINE_SCORE, LINE_WEIGHTS
+from metrics import History
+from replay import SYMMETRY_CELLS
+
+# tile exponents are looked up as 4-bit digits
+MAX_EXPONENT = 15
+TUPLE_SETS = {
+    # four 6-tuples: two straight 2x3 rectangles and two L-shapes, 4 x 64 MiB
+    '6': [[0, 1, 2, 3, 4, 5], [4, 5, 6, 7, 8, 9], [0, 1, 2, 4, 5, 6], [4, 5, 6, 8, 9, 10]],
+    # five 4-tuples: two rows and three 2x2 squares, 5 x 256 KiB
+    '4': [[0, 1, 2, 3], [4, 5, 6, 7], [0, 1, 4, 5], [1, 2, 5, 6], [5, 6, 9, 10]],
+}
+
+
+def afterstates(boards):
+    """
+    This function returns the (N, 4, 16) afterstates of (N, 16) exponent
+    boards for the four directions and the (N, 4) scores gained, all
+    directions in one table lookup.
+    """
+    lines = boards[:, LINES].reshape(-1, 4, 4, 4)
+    packed = lines.dot(LINE_WEIGHTS)
+    after = np.empty((len(boards), 4, 16), dtype=np.uint8)
+    np.put_along_axis(after, np.broadcast_to(LINES, after.shape), LINE_RESULT[packed].reshape(-1, 4, 16), axis=2)
+    return after, LINE_SCORE[packed].sum(axis=2)
+
+
+def observation_boards(observations):
+    return np.minimum(to_exponents(observations), MAX_EXPONENT)
+
+
+class NTupleAgent:
+    """
+    Class NTupleAgent
+    Same choose_action / store_transition / learn surface as DuelingDQN.
+    store_transition only queues the transition; learn() applies the TD(0)
+    updates of all queued transitions at once:
+        V(after) += alpha * (max_a' [score(s_, a') + V(after(s_, a'))] - V(after))
+    with a target of 0 when s_ is lost. The reward passed by the game is
+    not used, the tables learn the expected future game score. epsilon is
+    the probability of the greedy move like in DuelingDQN, the other moves
+    are random legal ones.
+    """
+    def __init__(self, n_actions=4, n_features=16, tuples='6', learning_rate=0.1, e_greedy=1., weights=None):
+        self.n_actions = n_actions
+        self.n_features = n_features
+        self.tuples = np.array(TUPLE_SETS[tuples] if isinstance(tuples, str) else tuples)
+        n_tuples, size = self.tuples.shape
+        # cells of the 8 symmetric copies of every tuple, (n_tuples * 8, size)
+        self.cells = SYMMETRY_CELLS[:, self.tuples].transpose(1, 0, 2).reshape(-1, size)
+        self.offsets = np.repeat(np.arange(n_tuples, dtype=np.int64) * 16 ** size, 8)
+        self.powers = 16 ** np.arange(size, dtype=np.int64)
+        self.weights = np.zeros(n_tuples * 16 ** size, dtype=np.float32) if weights is None else weights
+        # learning_rate is shared by the weights of one lookup
+        self.lr = learning_rate
+        self.alpha = learning_rate / len(self.cells)
+        self.epsilon = e_greedy
+        # choose_action only picks moves that change the board anyway
+        self.mask_legal = False
+        self.memory = None
+        self.pending = deque()
+        self.learn_step_counter = 0
+        self.cost = 0.
+        self.cost_his = History()
+
+    def indices(self, boards):
+        # (..., 16) exponent boards -> (..., n_tuples * 8) indices into weights
+        return boards[..., self.cells].dot(self.powers) + self.offsets
+
+    def values(self, boards):
+        return self.weights[self.indices(boards)].sum(axis=-1)
+
+    def choose_action(self, observation, legal=None):
+        board = observation_boards(observation)
+        after, score = afterstates(board)
+        moves = (after[0] != board).any(axis=1)
+        if legal is not None:
+            moves &= legal
+        if not moves.any():
+            return np.random.randint(0, self.n_actions)  # lost board, every move is a no-op
+        if np.random.uniform() < self.epsilon:
+            value = score[0] + self.values(after[0])
+            value[~moves] = -np.inf
+            return np.argmax(value)
+        return np.random.choice(np.flatnonzero(moves))
+
+    def store_transition(self, s, a, r, s_, done=False):
+        # copies, the env may reuse its observation arrays
+        self.pending.append((np.array(s), a, np.array(s_), done))
+
+    def learn(self, options=None, run_metadata=None):
+        # options/run_metadata are accepted for train_2048 and ignored, there is no session.
+        n = len(self.pending)
+        if n == 0:
+            return
+        s, a, s_, done = zip(*[self.pending.popleft() for _ in range(n)])
+        boards = observation_boards(np.array(s))
+        next_boards = observation_boards(np.array(s_))
+
+        after, _ = afterstates(boards)
+        index = self.indices(after[np.arange(n), np.array(a)])
+        value = self.weights[index].sum(axis=1)
+
+        next_after, next_score = afterstates(next_boards)
+        next_value = next_score + self.values(next_after)
+        moves = (next_after != next_boards[:, np.newaxis]).any(axis=2)
+        next_value[~moves] = -np.inf
+        target = next_value.max(axis=1)
+        target[~moves.any(axis=1) | np.array(done)] = 0.
+
+        error = (target - value).astype(np.float32)
+        # symmetric copies may hit the same weight, add.at accumulates them
+        np.add.at(self.weights, index, np.broadcast_to((self.alpha * error)[:, np.newaxis], index.shape))
+        self.cost = float(np.mean(np.square(error)))
+        self.cost_his.append(self.cost)
+        self.learn_step_counter += 1
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, tuples=self.tuples)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        data = np.load(path)
+        return cls(tuples=data['tuples'], weights=data['weights'], **kwargs)
@@ -0,0 +1,113 @@
+"""
+Pure-NumPy forward pass of the DuelingDQN eval_net, for processes that only
+choose actions and should not import TensorFlow.
+Weights are exported by DuelingDQN.export_weights() into an .npz holding
+float32, float16 or int8 (symmetric per-tensor scale) copies of the
+variables; NumpyDuelingNet computes in float32.
+"""
+import numpy as np
+
+# order of DuelingDQN.e_params
+PARAM_NAMES = ['conv1_w', 'conv1_b', 'conv11_w', 'conv11_b', 'conv12_w', 'conv12_b',
+               'fc4_w', 'fc4_b', 'value_w', 'value_b', 'advantage_w', 'advantage_b']
+DTYPES = ['float32', 'float16', 'int8']
+
+
+def save_weights(path, values, dtype='float32'):
+    arrays = {'dtype': np.array(dtype)}
+    for name, value in zip(PARAM_NAMES, values):
+        value = np.asarray(value, dtype=np.float32)
+        if dtype == 'int8':
+            scale = max(float(np.abs(value).max()) / 127, 1e-12)
+            arrays[name] = np.round(value / scale).astype(np.int8)
+            arrays[name + '_scale'] = np.array(scale, dtype=np.float32)
+        else:
+            arrays[name] = value.astype(dtype)
+    np.savez(path, **arrays)
+
+
+def load_weights(path):
+    """
+    This function returns the float32 weights of an .npz written by
+    save_weights, in the order of PARAM_NAMES.
+    """
+    with np.load(path) as f:
+        values = []
+        for name in PARAM_NAMES:
+            value = f[name].astype(np.float32)
+            if name + '_scale' in f:
+                value *= f[name + '_scale']
+            values.append(value)
+    return values
+
+
+class NumpyDuelingNet:
+    """
+    Class NumpyDuelingNet
+    Q-values of the eval_net computed with NumPy: the 1x1 conv, the 4x1 and
+    1x4 convs written as matrix products over the 4x4 board, the FC layer
+    and the value/advantage heads.
+    """
+    def __init__(self, values, n_actions=4):
+        self.n_actions = n_actions
+        self.epsilon = 1.
+        self.set_params(values)
+
+    @classmethod
+    def load(cls, path):
+        return cls(load_weights(path))
+
+    def set_params(self, values):
+        w1, b1, w11, b11, w12, b12, w4, b4, wv, bv, wa, ba = [np.asarray(v, dtype=np.float32) for v in values]
+        self.w1 = w1.reshape(-1, w1.shape[-1])     # [1, 1, channels, 64] -> [channels, 64]
+        self.b1 = b1
+        self.w11 = w11.reshape(-1, w11.shape[-1])  # [4, 1, 64, 128] -> [4*64, 128]
+        self.b11 = b11
+        self.w12 = w12.reshape(-1, w12.shape[-1])  # [1, 4, 64, 128] -> [4*64, 128]
+        self.b12 = b12
+        self.w4, self.b4 = w4, b4
+        self.wv, self.bv = wv, bv
+        self.wa, self.ba = wa, ba
+
+    def q_values(self, observations):
+        x = np.asarray(observations, dtype=np.float32).reshape(-1, 4, 4, len(self.w1))
+        n = len(x)
+        h1 = np.tanh(x.dot(self.w1) + self.b1)  # [n, y, x, 64]
+        c = h1.shape[-1]
+        # the 4x1 conv sums over y for every column x, the 1x4 conv over x for every row y
+        o11 = np.tanh(h1.transpose(0, 2, 1, 3).reshape(n * 4, 4 * c).dot(self.w11) + self.b11)
+        o12 = np.tanh(h1.reshape(n * 4, 4 * c).dot(self.w12) + self.b12)
+        flat = np.concatenate([o11.reshape(n, -1), o12.reshape(n, -1)], axis=1)
+        l4 = np.tanh(flat.dot(self.w4) + self.b4)
+        v = l4.dot(self.wv) + self.bv
+        a = l4.dot(self.wa) + self.ba
+        return v + (a - a.mean(axis=1, keepdims=True))
+
+    def choose_action(self, observation, legal=None):
+        # epsilon is the probability of the greedy action, like DuelingDQN.epsilon
+        if legal is not None and not legal.any():
+            legal = None
+        if np.random.uniform() < self.epsilon:
+            actions_value = self.q_values(observation[np.newaxis, :])[0]
+            if legal is not None:
+                actions_value[~legal] = -np.inf
+            return int(np.argmax(actions_value))
+        if legal is not None:
+            return np.random.choice(np.flatnonzero(legal))
+        return np.random.randint(0, self.n_actions)
+
+    def choose_actions(self, observations, legal=None):
+        observations = np.asarray(observations)
+        n = len(observations)
+        if legal is None:
+            actions = np.random.randint(0, self.n_actions, size=n)
+        else:
+            legal = legal | ~legal.any(axis=1, keepdims=True)
+            actions = np.argmax(np.where(legal, np.random.uniform(size=legal.shape), -1.), axis=1)
+        greedy = np.random.uniform(size=n) < self.epsilon
+        if greedy.any():
+            actions_value = self.q_values(observations[greedy])
+            if legal is not None:
+                actions_value[~legal[greedy]] = -np.inf
+            actions[greedy] = np.argmax(actions_value, axis=1)
+        return actions
@@ -0,0 +1,244 @@
+"""
+Offline training of DuelingDQN from recorded games (see trajectory.py),
+without running the environment.
+    python offline.py games.trj [more.trj ...] --passes 3 --batch-size 512
+A reader thread decodes the files chunk by chunk into packed transitions
+and hands them over through a queue of depth 2, so the next chunk is read
+while the learner trains on the current one. Transitions go through a
+bounded shuffle window before they are cut into minibatches; every
+transition is used once per pass.
+"""
+import argparse
+import queue
+import threading
+import time
+import numpy as np
+from replay import SymmetricMemory, unpack_states
+from trajectory import read_games, replay_game
+
+
+def game_transitions(board, steps, finished):
+    """
+    This function re-simulates a recorded game and returns its transitions
+    as packed arrays (s, a, r, s_, done).
+    """
+    n = len(steps)
+    s = np.empty(n, dtype=np.uint64)
+    a = np.empty(n, dtype=np.uint8)
+    r = np.empty(n, dtype=np.float32)
+    s_ = np.empty(n, dtype=np.uint64)
+    for i, (old, action, reward, new, _) in enumerate(replay_game(board, steps)):
+        s[i], a[i], r[i], s_[i] = old, action, reward, new
+    done = np.zeros(n, dtype=np.bool_)
+    if finished and n:
+        done[-1] = True
+    return s, a, r, s_, done
+
+
+def n_step_transitions(transitions, finished, n_step, gamma):
+    """
+    This function turns the one-step transitions of a game into n-step
+    transitions like replay.NStepMemory, vectorized over the game: R is a
+    dot product of sliding reward windows with the discounts, s_ the board
+    n_step - 1 steps later. The last steps of a finished game get the
+    shorter returns and done, those of an unfinished game are dropped.
+    """
+    s, a, r, s_, done = transitions
+    n = len(r)
+    if n == 0:
+        return transitions
+    windows = np.lib.stride_tricks.sliding_window_view(np.concatenate([r, np.zeros(n_step - 1, r.dtype)]), n_step)
+    ret = windows.dot(gamma ** np.arange(n_step)).astype(np.float32)
+    last = np.arange(n_step - 1, n + n_step - 1)
+    keep = n if finished else max(n - n_step + 1, 0)
+    last = np.minimum(last[:keep], n - 1)
+    return s[:keep], a[:keep], ret[:keep], s_[last], done[last]
+
+
+def concat(parts):
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def read_chunks(paths, chunk_size, n_step=1, gamma=0.95):
+    """
+    This generator yields the transitions of the passed trajectory files in
+    chunks of at least chunk_size transitions (whole games, the last chunk
+    may be smaller), as n-step transitions when n_step > 1.
+    """
+    parts = []
+    n = 0
+    for path in paths:
+        for seed, board, steps, summary in read_games(path):
+            transitions = game_transitions(board, steps, summary is not None)
+            if n_step > 1:
+                transitions = n_step_transitions(transitions, summary is not None, n_step, gamma)
+            parts.append(transitions)
+            n += len(transitions[0])
+            if n >= chunk_size:
+                yield concat(parts)
+                parts = []
+                n = 0
+    if parts:
+        yield concat(parts)
+
+
+class ChunkReader:
+    """
+    Class ChunkReader
+    Reads the chunks of `passes` passes over the files in a background
+    thread into a queue of `depth` chunks. wait_time is the time the
+    consumer spent waiting for the reader.
+    """
+    def __init__(self, paths, passes=1, chunk_size=65536, depth=2, n_step=1, gamma=0.95):
+        self.paths = paths
+        self.passes = passes
+        self.chunk_size = chunk_size
+        self.n_step = n_step
+        self.gamma = gamma
+        self.queue = queue.Queue(maxsize=depth)
+        self.wait_time = 0.
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for _ in range(self.passes):
+                for chunk in read_chunks(self.paths, self.chunk_size, self.n_step, self.gamma):
+                    self.queue.put(chunk)
+            self.queue.put(None)
+        except Exception as e:
+            self.queue.put(e)
+
+    def __iter__(self):
+        while True:
+            start = time.time()
+            chunk = self.queue.get()
+            self.wait_time += time.time() - start
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+def shuffled_batches(chunks, window, batch_size, seed=None):
+    """
+    This generator yields minibatches of packed transitions drawn from a
+    shuffle window of `window` transitions: once the window is full every
+    batch takes random slots out of it and the next incoming transitions
+    fill the freed slots. The window is drained in random order at the end;
+    an incomplete last batch is dropped.
+    """
+    rng = np.random.default_rng(seed)
+    window = max(window, batch_size)
+    buffer = None
+    size = 0
+    pending = None
+    for chunk in chunks:
+        pending = chunk if pending is None else concat([pending, chunk])
+        if buffer is None:
+            buffer = tuple(np.empty(window, dtype=x.dtype) for x in pending)
+        n = len(pending[0])
+        pos = min(n, window - size)
+        for x, y in zip(buffer, pending):
+            x[size:size + pos] = y[:pos]
+        size += pos
+        while size == window and n - pos >= batch_size:
+            index = rng.choice(window, size=batch_size, replace=False)
+            yield tuple(x[index] for x in buffer)
+            for x, y in zip(buffer, pending):
+                x[index] = y[pos:pos + batch_size]
+            pos += batch_size
+        pending = tuple(y[pos:] for y in pending)
+
+    if buffer is None:
+        return
+    rest = concat([tuple(x[:size] for x in buffer), pending])
+    order = rng.permutation(len(rest[0]))
+    for i in range(0, len(order) - batch_size + 1, batch_size):
+        yield tuple(x[order[i:i + batch_size]] for x in rest)
+
+
+class StreamMemory:
+    """
+    Class StreamMemory
+    Replay memory interface over a stream of packed minibatches, so that
+    DuelingDQN.learn() trains on them unchanged. It is read-only, there is
+    no store(). next_batch is None when the stream is exhausted.
+    """
+    prioritized = False
+    bytes_per_transition = 22
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.next_batch = next(self.batches, None)
+
+    def sample(self, batch_size):
+        s, a, r, s_, done = self.next_batch
+        self.next_batch = next(self.batches, None)
+        return unpack_states(s), a.astype(int), r, unpack_states(s_), done
+
+
+def train_offline(RL, memory, reader, report_interval=100):
+    """
+    This function calls RL.learn() until the stream of memory is exhausted
+    and reports updates/sec and the time spent waiting for input.
+    """
+    updates = 0
+    start = last = time.time()
+    while memory.next_batch is not None:
+        RL.learn()
+        updates += 1
+        if updates % report_interval == 0:
+            now = time.time()
+            print("updates: {}, cost: {:.5f}, updates/sec: {:.1f}, transitions/sec: {:.0f}, "
+                  "input wait: {:.1f}s".format(updates, RL.cost, report_interval / (now - last),
+                                               report_interval * RL.batch_size / (now - last), reader.wait_time))
+            last = now
+    elapsed = time.time() - start
+    print("{} updates in {:.1f}s, {:.1f} updates/sec, input wait {:.1f}s".format(
+        updates, elapsed, updates / max(elapsed, 1e-9), reader.wait_time))
+    return updates
+
+
+if __name__ == "__main__":
+    from RL_brain import DuelingDQN
+    from numpy_policy import DTYPES, load_weights
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='+', help="trajectory files written with run_this.py --record")
+    parser.add_argument('--passes', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--shuffle-window', type=int, default=100000, help="transitions in the shuffle buffer")
+    parser.add_argument('--chunk-size', type=int, default=65536, help="transitions decoded per read")
+    parser.add_argument('--symmetry', action='store_true',
+                        help="map every sampled transition through a random symmetry")
+    parser.add_argument('--n-step', type=int, default=1,
+                        help="train on n-step returns, bootstrapped with reward_decay ** n")
+    parser.add_argument('--fused-learn', action='store_true')
+    parser.add_argument('--double-q', action='store_true', help="Double-DQN target, needs --fused-learn")
+    parser.add_argument('--mask-legal', action='store_true')
+    parser.add_argument('--init-weights', help="start from eval_net weights exported to this .npz")
+    parser.add_argument('--export-weights', help="write the eval_net weights to this .npz")
+    parser.add_argument('--export-dtype', choices=DTYPES, default='float32')
+    parser.add_argument('--report-interval', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    reward_decay = 0.95
+    reader = ChunkReader(args.paths, args.passes, args.chunk_size, n_step=args.n_step, gamma=reward_decay)
+    memory = StreamMemory(shuffled_batches(iter(reader), args.shuffle_window, args.batch_size, args.seed))
+    RL = DuelingDQN(4, 16,
+                    learning_rate=1e-4,
+                    reward_decay=reward_decay,
+                    batch_size=args.batch_size,
+                    memory=SymmetricMemory(memory) if args.symmetry else memory,
+                    fused_learn=args.fused_learn,
+                    double_q=args.double_q,
+                    mask_legal=args.mask_legal,
+                    n_step=args.n_step)
+    if args.init_weights:
+        RL.set_eval_params(load_weights(args.init_weights))  # the target_net follows in the first learn()
+    train_offline(RL, memory, reader, args.report_interval)
+    if args.export_weights:
+        RL.export_weights(args.export_weights, args.export_dtype)
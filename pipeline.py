@@ -0,0 +1,177 @@
+"""
+Threaded training in one process: an actor thread steps the game and
+stores transitions while a learner thread calls learn() continuously.
+Both spend most of their time in sess.run, which releases the GIL, so
+acting and learning overlap instead of taking turns like in train_2048.
+    python run_this.py --threaded --replay-ratio 0.1
+"""
+import threading
+import time
+from metrics import Metrics
+
+
+class LockedMemory:
+    """
+    Class LockedMemory
+    Serializes store(), store_packed(), sample() and update_priorities() of
+    a replay memory shared by the actor and the learner thread. Everything
+    else is forwarded to the wrapped memory.
+    """
+    def __init__(self, memory):
+        self.memory = memory
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == 'memory':
+            raise AttributeError(name)
+        return getattr(self.memory, name)
+
+    def store(self, s, a, r, s_, done=False):
+        with self.lock:
+            self.memory.store(s, a, r, s_, done)
+
+    def sample(self, batch_size):
+        with self.lock:
+            return self.memory.sample(batch_size)
+
+    def update_priorities(self, sample_index, abs_errors):
+        with self.lock:
+            self.memory.update_priorities(sample_index, abs_errors)
+
+    def store_packed(self, s, a, r, s_, done):
+        with self.lock:
+            return self.memory.store_packed(s, a, r, s_, done)
+
+
+class ReplayRatioLimiter:
+    """
+    Class ReplayRatioLimiter
+    Keeps the number of updates close to replay_ratio updates per
+    transition stored after the first learn_start transitions. The learner
+    waits when it is ahead of the target, the actor when it is more than
+    `slack` updates ahead of the learner. stop() releases both.
+    """
+    def __init__(self, replay_ratio=0.1, learn_start=500, slack=10):
+        self.replay_ratio = replay_ratio
+        self.learn_start = learn_start
+        self.slack = slack
+        self.transitions = 0
+        self.updates = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+
+    def _target(self):
+        return self.replay_ratio * (self.transitions - self.learn_start)
+
+    def add_transition(self, n=1):
+        with self.condition:
+            self.transitions += n
+            self.condition.notify_all()
+            while not self.stopped and self._target() > self.updates + self.slack:
+                self.condition.wait()
+
+    def add_update(self):
+        with self.condition:
+            self.updates += 1
+            self.condition.notify_all()
+
+    def wait_for_learn(self):
+        """
+        This function blocks until the next update is due and returns False
+        once the limiter was stopped.
+        """
+        with self.condition:
+            while not self.stopped and self.updates >= self._target():
+                self.condition.wait()
+            return not self.stopped
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+def train_threaded(env, RL, replay_ratio=0.1, learn_start=500, max_steps=None, report_interval=10., metrics=None,
+                   spectator=None):
+    """
+    This function trains like train_2048 with acting and learning in two
+    threads, prints env steps/sec and updates/sec every report_interval
+    seconds and returns the number of steps taken.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    RL.memory = LockedMemory(RL.memory)
+    limiter = ReplayRatioLimiter(replay_ratio, learn_start)
+    errors = []
+
+    def learner():
+        try:
+            while limiter.wait_for_learn():
+                RL.learn()
+                limiter.add_update()
+        except Exception as e:
+            errors.append(e)
+            limiter.stop()
+
+    thread = threading.Thread(target=learner, daemon=True)
+    thread.start()
+
+    step = 0
+    start = last_report = time.time()
+    last_step = last_updates = 0
+    try:
+        for episode in range(20000000):
+            if limiter.stopped or (max_steps is not None and step >= max_steps):
+                break
+            observation = env.reset()
+            done = False
+            while not limiter.stopped:
+                action = RL.choose_action(observation, env.legal_actions() if RL.mask_legal else None)
+                observation_, reward, done = env.step(action)
+                if spectator is not None:
+                    spectator.publish(env, action, episode, step, done)
+                RL.store_transition(observation, action, reward, observation_, done)
+                limiter.add_transition()
+                observation = observation_
+                step += 1
+
+                now = time.time()
+                if now - last_report >= report_interval:
+                    updates = limiter.updates
+                    metrics.add('steps_per_sec', (step - last_step) / (now - last_report))
+                    metrics.add('updates_per_sec', (updates - last_updates) / (now - last_report))
+                    print("steps/sec: {:.0f}, updates/sec: {:.1f}, updates/transition: {:.3f}".format(
+                        (step - last_step) / (now - last_report), (updates - last_updates) / (now - last_report),
+                        updates / max(step - learn_start, 1)))
+                    last_report, last_step, last_updates = now, step, updates
+                if done or (max_steps is not None and step >= max_steps):
+                    break
+            if not done:
+                break
+            max_tile = max(max(row) for row in env.field)
+            metrics.add('score', env.score)
+            metrics.add('max_tile', max_tile)
+            metrics.add('moves', env.round)
+            if limiter.updates:
+                metrics.add('loss', RL.cost)  # written by the learner thread, sampled once per episode
+            metrics.log(episode=episode, step=step, score=env.score, max_tile=max_tile, moves=env.round,
+                        epsilon=RL.epsilon, loss=metrics['loss'].last, updates=limiter.updates,
+                        avg_score=metrics['score'].mean)
+
+            if episode % 5 == 0:
+                print("#" * 80)
+                print(episode, ",", int(step / 10), ",score:", env.score, ",e:", RL.epsilon)
+                score = metrics['score']
+                print("avg-score: {}, p50/p90/p99: {:.0f}/{:.0f}/{:.0f}".format(
+                    score.mean, score.quantile(0.5), score.quantile(0.9), score.quantile(0.99)))
+    finally:
+        limiter.stop()
+        thread.join()
+        RL.memory = RL.memory.memory
+    if errors:
+        raise errors[0]
+
+    elapsed = time.time() - start
+    print("{} steps, {} updates in {:.1f}s: {:.0f} steps/sec, {:.1f} updates/sec".format(
+        step, limiter.updates, elapsed, step / elapsed, limiter.updates / elapsed))
+    return step
@@ -0,0 +1,99 @@
+"""
+Low-overhead per-phase timers for the training loop.
+A loop calls tick(phase) after every phase; the time since the previous
+tick is booked on that phase. NullProfiler keeps the same interface and
+does nothing, so a disabled profiler costs one empty method call per phase.
+"""
+import os
+import time
+import numpy as np
+
+
+class NullProfiler:
+    trace_next = False
+
+    def tick(self, phase):
+        pass
+
+    def step_done(self):
+        pass
+
+    def learn_kwargs(self):
+        return {}
+
+    def learn_done(self, step):
+        pass
+
+
+class PhaseProfiler:
+    """
+    Class PhaseProfiler
+    Books the time between ticks on the ticked phase and prints a breakdown
+    of time share, mean and p99 latency and steps/sec every report_interval
+    steps. The latest `window` durations of every phase are kept for the
+    percentiles. When trace_dir is set, one learn() per report is run with
+    full tracing and written as a Chrome trace (chrome://tracing).
+    """
+    def __init__(self, report_interval=10000, window=4096, trace_dir=None):
+        self.report_interval = report_interval
+        self.window = window
+        self.trace_dir = trace_dir
+        self.trace_next = trace_dir is not None
+        self.run_metadata = None
+        self.phases = {}
+        self.steps = 0
+        self.window_start = self.last = time.perf_counter()
+
+    def tick(self, phase):
+        now = time.perf_counter()
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = {'total': 0., 'count': 0, 'samples': np.zeros(self.window)}
+        stats['samples'][stats['count'] % self.window] = now - self.last
+        stats['total'] += now - self.last
+        stats['count'] += 1
+        self.last = now
+
+    def step_done(self):
+        self.steps += 1
+        if self.steps % self.report_interval == 0:
+            self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.window_start
+        total = sum(stats['total'] for stats in self.phases.values())
+        print("-" * 80)
+        print("profile: {} steps, {:.1f} steps/sec".format(self.report_interval, self.report_interval / elapsed))
+        print("{:18s} {:>7s} {:>8s} {:>12s} {:>12s}".format("phase", "share", "calls", "mean(us)", "p99(us)"))
+        for phase, stats in sorted(self.phases.items(), key=lambda item: -item[1]['total']):
+            samples = stats['samples'][:min(stats['count'], self.window)]
+            print("{:18s} {:6.1f}% {:8d} {:12.1f} {:12.1f}".format(
+                phase, 100 * stats['total'] / total, stats['count'],
+                1e6 * stats['total'] / stats['count'], 1e6 * np.percentile(samples, 99)))
+        self.phases = {}
+        self.trace_next = self.trace_dir is not None
+        self.window_start = self.last = time.perf_counter()
+
+    def learn_kwargs(self):
+        """
+        This function returns the keyword arguments of the next learn() call:
+        the tracing options when this call is sampled for a timeline.
+        """
+        if not self.trace_next:
+            return {}
+        import tensorflow as tf
+        self.run_metadata = tf.RunMetadata()
+        return {'options': tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+                'run_metadata': self.run_metadata}
+
+    def learn_done(self, step):
+        if self.run_metadata is None:
+            return
+        from tensorflow.python.client import timeline
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = os.path.join(self.trace_dir, "timeline_{}.json".format(step))
+        with open(path, 'w') as f:
+            f.write(timeline.Timeline(self.run_metadata.step_stats).generate_chrome_trace_format())
+        print("learn() timeline written to", path)
+        self.run_metadata = None
+        self.trace_next = False
@@ -0,0 +1,659 @@
+"""
+Replay memories for DuelingDQN.
+Every memory implements
+ - store(s, a, r, s_, done)
+ - sample(batch_size) -> (s, a, r, s_, done) as NumPy arrays
+ - bytes_per_transition
+ - get_state() -> (arrays, values) and set_state(arrays, values) for checkpoints
+Prioritized memories set prioritized = True, additionally return the sample
+indices and importance-sampling weights from sample() and implement
+update_priorities(sample_index, abs_errors).
+SymmetricMemory wraps any of them to augment transitions with the 8
+symmetries of the board, NStepMemory to store n-step transitions.
+"""
+from collections import deque
+from multiprocessing import shared_memory
+import json
+import os
+import numpy as np
+
+# bit offset of every tile in a packed board, see env/bitboard.py
+SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+# exponent -> observation feature, equal to format_state()
+FEATURES = np.arange(16, dtype=np.float32) / 10
+
+
+def _build_symmetries():
+    """
+    This function returns the cell permutations of the 8 rotations and
+    reflections of a 4x4 board, new[i] = old[cells[i]], and for every
+    symmetry the new action of every old action (0,1,2,3 = N,E,S,W).
+    """
+    grid = np.arange(16).reshape(4, 4)
+    offsets = [(-1, 0), (0, 1), (1, 0), (0, -1)]  # N,E,S,W as (dy, dx)
+    cells, actions = [], []
+    for flip in [False, True]:
+        for k in range(4):
+            g = np.rot90(grid, k)
+            if flip:
+                g = g[:, ::-1]
+            # old direction of every new direction, read off around an inner cell
+            center = np.array(divmod(g[1, 1], 4))
+            new_to_old = [offsets.index(tuple(np.array(divmod(g[1 + dy, 1 + dx], 4)) - center))
+                          for dy, dx in offsets]
+            cells.append(g.ravel())
+            actions.append(np.argsort(new_to_old))
+    return np.array(cells), np.array(actions)
+
+
+# SYMMETRY_CELLS[k] permutes the cells and SYMMETRY_ACTIONS[k] the actions of symmetry k, 0 is identity
+SYMMETRY_CELLS, SYMMETRY_ACTIONS = _build_symmetries()
+
+
+def apply_symmetries(s, a, s_, symmetries):
+    """
+    This function maps a batch of transitions through one symmetry per row
+    with a single gather per array. Observations may have several features
+    per cell (one-hot).
+    """
+    n = len(a)
+    cells = SYMMETRY_CELLS[symmetries][:, :, np.newaxis]
+    return (np.take_along_axis(s.reshape(n, 16, -1), cells, axis=1).reshape(n, -1),
+            SYMMETRY_ACTIONS[symmetries, a],
+            np.take_along_axis(s_.reshape(n, 16, -1), cells, axis=1).reshape(n, -1))
+
+
+def pack_states(states):
+    """
+    This function packs observations of shape (..., 16) into uint64 boards of
+    4-bit tile exponents.
+    """
+    exponents = np.rint(np.asarray(states) * 10).astype(np.uint64)
+    return np.bitwise_or.reduce(exponents << SHIFTS, axis=-1)
+
+
+# 16^i for 8 cells, sums of exponents times these are exact in float64
+_HALF_WEIGHTS = 16. ** np.arange(8)
+
+
+def pack_state(state, scratch):
+    """
+    This function packs a single observation like pack_states, using the
+    float64 array scratch of 16 elements instead of temporary arrays.
+    """
+    np.multiply(state, 10, out=scratch)
+    np.rint(scratch, out=scratch)
+    return int(scratch[:8].dot(_HALF_WEIGHTS)) | int(scratch[8:].dot(_HALF_WEIGHTS)) << 32
+
+
+def unpack_states(boards):
+    """
+    This function decodes uint64 boards into float32 observations of shape
+    (..., 16) in one vectorized step.
+    """
+    return FEATURES[(np.asarray(boards, dtype=np.uint64)[..., np.newaxis] >> SHIFTS) & np.uint64(0xF)]
+
+
+class Memory:
+    """
+    Class Memory
+    The default replay memory: one float64 row [s, a, r, s_, done] per
+    transition. Like the original DuelingDQN memory it samples uniformly over
+    the whole capacity, also before the buffer is filled.
+    """
+    def __init__(self, memory_size, n_features):
+        self.memory_size = memory_size
+        self.n_features = n_features
+        self.memory = np.zeros((memory_size, n_features * 2 + 3))
+        self.memory_index = 0
+        self.bytes_per_transition = self.memory.itemsize * self.memory.shape[1]
+
+    def store(self, s, a, r, s_, done=False):
+        # row [s, a, r, s_, done] written in place
+        n = self.n_features
+        row = self.memory[self.memory_index]
+        row[:n] = s
+        row[n] = a
+        row[n + 1] = r
+        row[n + 2:2 * n + 2] = s_
+        row[-1] = done
+        self.memory_index += 1
+        if self.memory_index == self.memory_size:
+            self.memory_index = 0
+
+    def sample(self, batch_size):
+        n = self.n_features
+        sample_index = np.random.choice(self.memory_size, size=batch_size)
+        batch_memory = self.memory[sample_index, :]
+        return (batch_memory[:, :n],
+                batch_memory[:, n].astype(int),
+                batch_memory[:, n + 1],
+                batch_memory[:, n + 2:2 * n + 2],
+                batch_memory[:, -1].astype(bool))
+
+    def get_state(self):
+        return {'memory': self.memory}, {'memory_index': self.memory_index}
+
+    def set_state(self, arrays, values):
+        self.memory = arrays['memory']
+        self.memory_index = values['memory_index']
+
+
+class PackedMemory:
+    """
+    Class PackedMemory
+    A compact replay memory for 4x4 boards: s and s_ are stored as uint64
+    boards of 4-bit tile exponents (tiles up to 32768), the action as uint8,
+    the reward as float32 and done as bool, i.e. 22 bytes per transition.
+    Only filled rows are sampled.
+    """
+    def __init__(self, memory_size, n_features=16):
+        assert n_features == 16, "PackedMemory only stores 4x4 boards"
+        self.memory_size = memory_size
+        self.n_features = n_features
+        self.s = np.zeros(memory_size, dtype=np.uint64)
+        self.a = np.zeros(memory_size, dtype=np.uint8)
+        self.r = np.zeros(memory_size, dtype=np.float32)
+        self.s_ = np.zeros(memory_size, dtype=np.uint64)
+        self.done = np.zeros(memory_size, dtype=np.bool_)
+        self.memory_index = 0
+        self.memory_counter = 0
+        self.bytes_per_transition = sum(x.itemsize for x in [self.s, self.a, self.r, self.s_, self.done])
+        self._scratch = np.empty(16)
+
+    def __len__(self):
+        return min(self.memory_counter, self.memory_size)
+
+    def store(self, s, a, r, s_, done=False):
+        i = self.memory_index
+        self.s[i] = pack_state(s, self._scratch)
+        self.a[i] = a
+        self.r[i] = r
+        self.s_[i] = pack_state(s_, self._scratch)
+        self.done[i] = done
+        self.memory_counter += 1
+        self.memory_index += 1
+        if self.memory_index == self.memory_size:
+            self.memory_index = 0
+
+    def store_packed(self, s, a, r, s_, done):
+        """
+        This function stores a batch of transitions that are packed already,
+        e.g. received from remote actors, with one slice assignment per array.
+        """
+        index = (self.memory_index + np.arange(len(a))) % self.memory_size
+        self.s[index] = s
+        self.a[index] = a
+        self.r[index] = r
+        self.s_[index] = s_
+        self.done[index] = done
+        self.memory_counter += len(a)
+        self.memory_index = (self.memory_index + len(a)) % self.memory_size
+        return index
+
+    def sample(self, batch_size):
+        sample_index = np.random.randint(0, len(self), size=batch_size)
+        return (unpack_states(self.s[sample_index]),
+                self.a[sample_index].astype(int),
+                self.r[sample_index],
+                unpack_states(self.s_[sample_index]),
+                self.done[sample_index])
+
+    def get_state(self):
+        return ({'s': self.s, 'a': self.a, 'r': self.r, 's_': self.s_, 'done': self.done},
+                {'memory_index': self.memory_index, 'memory_counter': self.memory_counter})
+
+    def set_state(self, arrays, values):
+        for key, array in arrays.items():
+            setattr(self, key, array)
+        self.memory_index = values['memory_index']
+        self.memory_counter = values['memory_counter']
+
+
+class SumTree:
+    """
+    Class SumTree
+    Array-based binary sum-tree: tree[1] is the total, the children of node i
+    are 2i and 2i+1 and the priorities are the leaves tree[size:2*size], size
+    being capacity rounded up to a power of two. Batched sampling and
+    updates walk all indices one level at a time, O(log n) NumPy calls per
+    batch.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.depth = self.size.bit_length() - 1
+        self.tree = np.zeros(2 * self.size)
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, data_index, priorities):
+        idx = np.asarray(data_index) + self.size
+        self.tree[idx] = priorities
+        for _ in range(self.depth):
+            idx = np.unique(idx // 2)
+            self.tree[idx] = self.tree[2 * idx] + self.tree[2 * idx + 1]
+
+    def update_one(self, data_index, priority):
+        # single leaf, e.g. a new transition: scalar walk up without temporary arrays
+        tree = self.tree
+        i = data_index + self.size
+        tree[i] = priority
+        i //= 2
+        while i >= 1:
+            tree[i] = tree[2 * i] + tree[2 * i + 1]
+            i //= 2
+
+    def get_leaves(self, values):
+        """
+        This function returns the data index of the leaf every value falls
+        into, values being cumulative priorities in [0, total).
+        """
+        values = np.array(values, dtype=np.float64)
+        idx = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * idx
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            idx = left + go_right
+        return idx - self.size
+
+
+class PrioritizedMemory(PackedMemory):
+    """
+    Class PrioritizedMemory
+    Prioritized experience replay on top of the packed layout. New
+    transitions get the current max priority, minibatches are drawn from
+    batch_size equal segments of the sum-tree and come with normalized
+    importance-sampling weights; learn() feeds back the absolute TD errors
+    through update_priorities().
+    """
+    prioritized = True
+
+    def __init__(self, memory_size, n_features=16, alpha=0.6, beta=0.4, beta_increment=1e-4,
+                 epsilon=0.01, abs_err_upper=1.):
+        PackedMemory.__init__(self, memory_size, n_features)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon  # avoid zero priority
+        self.abs_err_upper = abs_err_upper  # clipped abs error
+        self.tree = SumTree(memory_size)
+        self.max_priority = abs_err_upper ** alpha
+        self.bytes_per_transition += self.tree.tree.itemsize * 2 * self.tree.size // memory_size
+
+    def store(self, s, a, r, s_, done=False):
+        i = self.memory_index
+        PackedMemory.store(self, s, a, r, s_, done)
+        self.tree.update_one(i, self.max_priority)
+
+    def store_packed(self, s, a, r, s_, done):
+        index = PackedMemory.store_packed(self, s, a, r, s_, done)
+        self.tree.update(index, self.max_priority)
+        return index
+
+    def sample(self, batch_size):
+        """
+        This function returns (s, a, r, s_, done, sample_index, is_weights).
+        """
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        sample_index = self.tree.get_leaves(np.minimum(values, np.nextafter(total, 0)))
+        sample_index = np.minimum(sample_index, len(self) - 1)
+
+        self.beta = min(1., self.beta + self.beta_increment)
+        # rounding in the prefix search may land on an empty leaf, stored priorities are >= epsilon ** alpha
+        priorities = np.maximum(self.tree.tree[sample_index + self.tree.size], self.epsilon ** self.alpha)
+        probs = priorities / total
+        is_weights = np.power(len(self) * probs, -self.beta)
+        is_weights /= is_weights.max()
+        return (unpack_states(self.s[sample_index]),
+                self.a[sample_index].astype(int),
+                self.r[sample_index],
+                unpack_states(self.s_[sample_index]),
+                self.done[sample_index],
+                sample_index,
+                is_weights.astype(np.float32))
+
+    def update_priorities(self, sample_index, abs_errors):
+        priorities = np.power(np.minimum(abs_errors + self.epsilon, self.abs_err_upper), self.alpha)
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(sample_index, priorities)
+
+    def get_state(self):
+        arrays, values = PackedMemory.get_state(self)
+        arrays['tree'] = self.tree.tree
+        values.update(beta=self.beta, max_priority=self.max_priority)
+        return arrays, values
+
+    def set_state(self, arrays, values):
+        arrays = dict(arrays)
+        self.tree.tree = arrays.pop('tree')
+        PackedMemory.set_state(self, arrays, values)
+        self.beta = values['beta']
+        self.max_priority = values['max_priority']
+
+
+class MemmapMemory:
+    """
+    Class MemmapMemory
+    The packed layout of PackedMemory kept in np.memmap files under `path`,
+    so the capacity is bounded by disk instead of RAM. Transitions are
+    collected in a chunk in RAM and written to the files as one sequential
+    slice when it is full; sampled indices are sorted before the gather so
+    the reads walk the files in order. meta.json records the capacity and
+    the write position, so an existing buffer is reopened instantly; it
+    must be reopened with the same memory_size. Unwritten transitions of
+    the current chunk are sampled as well, close() writes them out.
+    """
+    FIELDS = [('s', np.uint64), ('a', np.uint8), ('r', np.float32), ('s_', np.uint64), ('done', np.bool_)]
+
+    def __init__(self, memory_size, n_features=16, path='replay_memmap', chunk_size=4096):
+        assert n_features == 16, "MemmapMemory only stores 4x4 boards"
+        self.n_features = n_features
+        self.path = path
+        self.chunk_size = chunk_size
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['memory_size'] != memory_size:
+                raise ValueError("{} holds a memory of size {}, not {}".format(
+                    path, meta['memory_size'], memory_size))
+            mode = 'r+'
+        else:
+            os.makedirs(path, exist_ok=True)
+            meta = {'memory_size': memory_size, 'memory_index': 0, 'memory_counter': 0}
+            mode = 'w+'
+        self.memory_size = memory_size
+        self.memory_index = meta['memory_index']
+        self.memory_counter = meta['memory_counter']
+        for key, dtype in self.FIELDS:
+            setattr(self, key, np.memmap(os.path.join(path, key + '.dat'), dtype=dtype, mode=mode,
+                                         shape=(memory_size,)))
+        self.chunk = {key: np.zeros(chunk_size, dtype=dtype) for key, dtype in self.FIELDS}
+        self.chunk_len = 0
+        self._scratch = np.empty(16)
+        self.bytes_per_transition = sum(np.dtype(dtype).itemsize for _, dtype in self.FIELDS)
+        if mode == 'w+':
+            self._write_meta()
+
+    def __len__(self):
+        return min(self.memory_counter, self.memory_size) + self.chunk_len
+
+    def _write_meta(self):
+        meta = {'memory_size': self.memory_size, 'memory_index': self.memory_index,
+                'memory_counter': self.memory_counter}
+        with open(os.path.join(self.path, 'meta.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(self.path, 'meta.json.tmp'), os.path.join(self.path, 'meta.json'))
+
+    def store(self, s, a, r, s_, done=False):
+        i = self.chunk_len
+        self.chunk['s'][i] = pack_state(s, self._scratch)
+        self.chunk['a'][i] = a
+        self.chunk['r'][i] = r
+        self.chunk['s_'][i] = pack_state(s_, self._scratch)
+        self.chunk['done'][i] = done
+        self.chunk_len += 1
+        if self.chunk_len == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        This function appends the chunk to the files, wrapping at the end.
+        """
+        start = 0
+        while start < self.chunk_len:
+            n = min(self.chunk_len - start, self.memory_size - self.memory_index)
+            for key, _ in self.FIELDS:
+                getattr(self, key)[self.memory_index:self.memory_index + n] = self.chunk[key][start:start + n]
+            self.memory_index = (self.memory_index + n) % self.memory_size
+            self.memory_counter += n
+            start += n
+        self.chunk_len = 0
+        self._write_meta()
+
+    def sample(self, batch_size):
+        stored = min(self.memory_counter, self.memory_size)
+        sample_index = np.sort(np.random.randint(0, len(self), size=batch_size))
+        in_chunk = sample_index >= stored
+        batch = {}
+        for key, _ in self.FIELDS:
+            values = getattr(self, key)[np.minimum(sample_index, stored - 1)] if stored else \
+                np.zeros(batch_size, dtype=self.chunk[key].dtype)
+            values[in_chunk] = self.chunk[key][sample_index[in_chunk] - stored]
+            batch[key] = values
+        return (unpack_states(batch['s']),
+                batch['a'].astype(int),
+                batch['r'],
+                unpack_states(batch['s_']),
+                batch['done'])
+
+    def get_state(self):
+        # the files are the state, a checkpoint only records where they are and the write position
+        self.flush()
+        for key, _ in self.FIELDS:
+            getattr(self, key).flush()
+        return {}, {'path': os.path.abspath(self.path), 'memory_index': self.memory_index,
+                    'memory_counter': self.memory_counter}
+
+    def set_state(self, arrays, values):
+        """
+        This function reopens the files of a checkpoint and rolls the write
+        position back to it. Transitions written after the checkpoint are not
+        removed from the files: they are overwritten by the next stores and
+        sampled until then once the buffer has wrapped.
+        """
+        self.__init__(self.memory_size, self.n_features, values['path'], self.chunk_size)
+        if 'memory_index' in values:
+            self.memory_index = values['memory_index']
+            self.memory_counter = values['memory_counter']
+            self._write_meta()
+
+    def close(self):
+        """
+        This function writes the chunk out and flushes the files.
+        """
+        self.flush()
+        for key, _ in self.FIELDS:
+            getattr(self, key).flush()
+
+
+class SharedReplay:
+    """
+    Class SharedReplay
+    A ring buffer living in one multiprocessing.shared_memory block, so that
+    actor processes can write transitions the learner samples from without
+    pickling anything. The capacity is split into one segment per writer;
+    every writer only touches its own segment and its own counter, therefore
+    no lock is needed. A row may be sampled while its writer overwrites it,
+    which is accepted for replay.
+    """
+    def __init__(self, capacity, n_features, n_writers, name=None, writer_id=None):
+        self.segment = capacity // n_writers
+        self.capacity = self.segment * n_writers
+        self.n_features = n_features
+        self.n_writers = n_writers
+        self.writer_id = writer_id
+
+        layout = [('s', np.float32, (self.capacity, n_features)),
+                  ('a', np.uint8, (self.capacity,)),
+                  ('r', np.float32, (self.capacity,)),
+                  ('s_', np.float32, (self.capacity, n_features)),
+                  ('done', np.bool_, (self.capacity,)),
+                  ('counts', np.int64, (n_writers,))]
+        size = 0
+        offsets = []
+        for _, dtype, shape in layout:
+            size = -(-size // 8) * 8  # 8-byte alignment
+            offsets.append(size)
+            size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+
+        for (key, dtype, shape), offset in zip(layout, offsets):
+            setattr(self, key, np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+        if self.owner:
+            self.counts[:] = 0
+        self.bytes_per_transition = sum(np.dtype(dtype).itemsize * int(np.prod(shape[1:]))
+                                        for _, dtype, shape in layout[:-1])
+
+    def __len__(self):
+        return int(np.minimum(self.counts, self.segment).sum())
+
+    def total_stored(self):
+        return int(self.counts.sum())
+
+    def store(self, s, a, r, s_, done=False):
+        count = self.counts[self.writer_id]
+        i = self.writer_id * self.segment + count % self.segment
+        self.s[i] = s
+        self.a[i] = a
+        self.r[i] = r
+        self.s_[i] = s_
+        self.done[i] = done
+        self.counts[self.writer_id] = count + 1
+
+    def sample(self, batch_size):
+        filled = np.minimum(self.counts, self.segment)
+        ends = np.cumsum(filled)
+        u = np.random.randint(0, ends[-1], size=batch_size)
+        writer = np.searchsorted(ends, u, side='right')
+        sample_index = writer * self.segment + u - (ends[writer] - filled[writer])
+        return (self.s[sample_index], self.a[sample_index].astype(int), self.r[sample_index],
+                self.s_[sample_index], self.done[sample_index])
+
+    def close(self):
+        # drop the views before the buffer is released
+        for key in ['s', 'a', 'r', 's_', 'done', 'counts']:
+            setattr(self, key, None)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SymmetricMemory:
+    """
+    Class SymmetricMemory
+    Wraps a replay memory and augments it with the 8 symmetries of the
+    board. With expand=False every sampled transition is mapped through a
+    random symmetry; with expand=True every transition is stored 8 times,
+    once per symmetry, so the wrapped memory should be 8 times larger to
+    cover the same number of environment steps. Everything else is
+    forwarded to the wrapped memory.
+    """
+    def __init__(self, memory, expand=False):
+        self.memory = memory
+        self.expand = expand
+
+    def __getattr__(self, name):
+        if name == 'memory':
+            raise AttributeError(name)
+        return getattr(self.memory, name)
+
+    def __len__(self):
+        return len(self.memory)
+
+    def store(self, s, a, r, s_, done=False):
+        if not self.expand:
+            self.memory.store(s, a, r, s_, done)
+            return
+        s, s_ = np.asarray(s).reshape(16, -1), np.asarray(s_).reshape(16, -1)
+        for cells, actions in zip(SYMMETRY_CELLS, SYMMETRY_ACTIONS):
+            self.memory.store(s[cells].ravel(), actions[a], r, s_[cells].ravel(), done)
+
+    def sample(self, batch_size):
+        batch = self.memory.sample(batch_size)
+        if self.expand:
+            return batch
+        s, a, s_ = apply_symmetries(batch[0], batch[1], batch[3], np.random.randint(0, 8, size=len(batch[1])))
+        return (s, a, batch[2], s_) + tuple(batch[4:])
+
+
+class NStepMemory:
+    """
+    Class NStepMemory
+    Wraps a replay memory and stores n-step transitions (s_t, a_t, R, s_t+n,
+    done) with R = r_t + gamma r_t+1 + ... + gamma^(n-1) r_t+n-1. The last
+    n_step steps of the episode are kept in a window and the oldest one is
+    stored as soon as its n rewards are known; R is one dot product of the
+    reward ring with the discounts rotated to the oldest step. When the
+    episode is done, the rest of the window is stored with the shorter
+    returns and done, so every stored transition is bootstrapped with
+    gamma^n_step (DuelingDQN(n_step=...)). The window of an episode that
+    ends without done (the next s is not the last s_) is dropped, so is the
+    window at a checkpoint. Everything else is forwarded to the wrapped
+    memory.
+    """
+    def __init__(self, memory, n_step=3, gamma=0.95):
+        self.memory = memory
+        self.n_step = n_step
+        self.gamma = gamma
+        # discounts[k][j]: discount of ring slot j when the oldest step is in slot k
+        self.discounts = np.array([np.roll(gamma ** np.arange(n_step), k) for k in range(n_step)])
+        self.rewards = np.zeros(n_step)  # zero in slots outside the window
+        self.states = deque()
+        self.actions = deque()
+        self.start = 0
+        self.last_s_ = None
+
+    def __getattr__(self, name):
+        if name == 'memory':
+            raise AttributeError(name)
+        return getattr(self.memory, name)
+
+    def __len__(self):
+        return len(self.memory)
+
+    def _clear(self):
+        self.states.clear()
+        self.actions.clear()
+        self.rewards[:] = 0
+        self.start = 0
+
+    def _store_oldest(self, s_, done):
+        ret = self.rewards.dot(self.discounts[self.start])
+        self.memory.store(self.states.popleft(), self.actions.popleft(), ret, s_, done)
+        self.rewards[self.start] = 0
+        self.start = (self.start + 1) % self.n_step
+
+    def store(self, s, a, r, s_, done=False):
+        if self.states and not np.array_equal(s, self.last_s_):
+            self._clear()  # new episode without done
+        # copies, the env may reuse its observation arrays
+        self.rewards[(self.start + len(self.states)) % self.n_step] = r
+        self.states.append(np.array(s))
+        self.actions.append(a)
+        self.last_s_ = np.array(s_)
+        if done:
+            while self.states:
+                self._store_oldest(s_, True)
+            self.start = 0
+        elif len(self.states) == self.n_step:
+            self._store_oldest(s_, False)
+
+
+MEMORIES = {'dense': Memory, 'packed': PackedMemory, 'prioritized': PrioritizedMemory, 'memmap': MemmapMemory}
+
+
+if __name__ == "__main__":
+    import tempfile
+    # memory-per-transition report
+    for key, memory_class in sorted(MEMORIES.items()):
+        if memory_class is MemmapMemory:
+            memory = MemmapMemory(1000, 16, path=tempfile.mkdtemp())
+        else:
+            memory = memory_class(1000, 16)
+        print("{:8s} {:4d} bytes/transition, {:8.1f} MiB per million transitions".format(
+            key, memory.bytes_per_transition, memory.bytes_per_transition * 1e6 / 2 ** 20))
@@ -1,26 +1,81 @@
-from RL_brain import DuelingDQN
-from env.game import Game
-from collections import deque
+from ntuple import TUPLE_SETS, NTupleAgent
+from env.engines import ENGINES
+from env.spectator import DEFAULT_NAME, SpectatorSlot
+from replay import MEMORIES, NStepMemory, SymmetricMemory
+from profiler import NullProfiler, PhaseProfiler
+from checkpoint import Checkpointer, load_args, load_checkpoint
+from numpy_policy import DTYPES
+from trajectory import TrajectoryWriter
+from pipeline import train_threaded
+from evaluate import Evaluator, print_summary
+from metrics import Metrics, MetricsSink
+import argparse
+import os
+import random
+import time
 import numpy as np
 
 
-def train_2048():
+def make_memory(args, n_features, gamma):
+    if args.memory == 'memmap':
+        memory = MEMORIES['memmap'](args.memory_size, n_features, path=args.memory_path)
+    else:
+        memory = MEMORIES[args.memory](args.memory_size, n_features)
+    if args.symmetry != 'none':
+        memory = SymmetricMemory(memory, expand=args.symmetry == 'expand')
+    if args.n_step > 1:
+        memory = NStepMemory(memory, args.n_step, gamma)
+    return memory
+
+
+def train_2048(env, RL, max_steps=None, profiler=None, checkpointer=None, train_state=None, evaluator=None,
+               metrics=None, spectator=None, learn_start=500):
+    if profiler is None:
+        profiler = NullProfiler()
+    if metrics is None:
+        metrics = Metrics()
     step = 0
-    scores = deque(maxlen=4000)
-    for episode in range(20000000):
-        observation = env.reset()  # initial observation
+    first_episode = 0
+    observation = None
+    if train_state is not None:
+        # resume, possibly in the middle of an episode
+        step = train_state['step']
+        first_episode = train_state['episode']
+        if 'metrics' in train_state:
+            metrics = train_state['metrics']
+        else:
+            for score in train_state['scores']:
+                metrics.add('score', score)
+        observation = train_state['observation']
+    episode_start, episode_start_step = time.time(), step
+    report_start, report_episode = episode_start, first_episode
+    for episode in range(first_episode, 20000000):
+        if max_steps is not None and step >= max_steps:
+            break
+        if observation is None:
+            observation = env.reset()  # initial observation
 
         while True:
+            profiler.tick('other')
             # RL choose action based on observation
-            action = RL.choose_action(observation)
+            action = RL.choose_action(observation, env.legal_actions() if RL.mask_legal else None)
+            profiler.tick('choose_action')
 
             # RL take action and get next observation and reward
             observation_, reward, done = env.step(action)
+            profiler.tick('env_step')
 
-            RL.store_transition(observation, action, reward, observation_)
+            if spectator is not None:
+                spectator.publish(env, action, episode, step, done)
 
-            if (step > 500) and (step % 10 == 0):
-                RL.learn()
+            RL.store_transition(observation, action, reward, observation_, done)
+            profiler.tick('store_transition')
+
+            if (step > learn_start) and (step % 10 == 0):
+                RL.learn(**profiler.learn_kwargs())
+                profiler.tick('learn')
+                profiler.learn_done(step)
+                metrics.add('loss', RL.cost)
 
             if step % 1000 == 0:
                 print("step", step, "reward:", reward, "action:", action)
@@ -29,27 +84,193 @@ def train_2048():
             observation = observation_
 
             step += 1
+            profiler.step_done()
             # break while loop when end of this episode
             if done:
                 break
-        scores.append(env.score)
+            if checkpointer is not None and checkpointer.stop_requested:
+                checkpointer.save(RL, {'episode': episode, 'step': step, 'metrics': metrics,
+                                       'env': env, 'observation': observation})
+                return step
+        now = time.time()
+        max_tile = max(max(row) for row in env.field)
+        steps_per_sec = (step - episode_start_step) / max(now - episode_start, 1e-9)
+        episode_start, episode_start_step = now, step
+        metrics.add('score', env.score)
+        metrics.add('max_tile', max_tile)
+        metrics.add('moves', env.round)
+        metrics.add('steps_per_sec', steps_per_sec)
+        metrics.log(episode=episode, step=step, score=env.score, max_tile=max_tile, moves=env.round,
+                    epsilon=RL.epsilon, loss=metrics['loss'].last, steps_per_sec=steps_per_sec,
+                    avg_score=metrics['score'].mean)
 
         if episode % 5 == 0:
+            games_per_sec = (episode + 1 - report_episode) / max(now - report_start, 1e-9)
+            report_start, report_episode = now, episode + 1
             print("#" * 80)
             print(episode, ",", int(step / 10), ",score:", env.score, ",e:", RL.epsilon)
-            print("avg-score: {}".format(np.mean(list(scores)[-1500:])))
+            score = metrics['score']
+            print("avg-score: {}, p50/p90/p99: {:.0f}/{:.0f}/{:.0f}, games/sec: {:.2f}".format(
+                score.mean, score.quantile(0.5), score.quantile(0.9), score.quantile(0.99), games_per_sec))
 
         if episode % 100 == 0:
             print(observation)
             env.show()
+        observation = None
+
+        if evaluator is not None:
+            result = evaluator.poll()
+            if result is not None:
+                print("#" * 80)
+                print("evaluation of episode", result[0])
+                print_summary(result[1])
+            if evaluator.due(episode):
+                evaluator.submit(RL.get_eval_params(), episode)
+
+        if checkpointer is not None and checkpointer.due(episode):
+            checkpointer.save(RL, {'episode': episode + 1, 'step': step, 'metrics': metrics,
+                                   'env': env, 'observation': None})
+            if checkpointer.stop_requested:
+                return step
+    return step
 
 if __name__ == "__main__":
-    env = Game()
-    RL = DuelingDQN(env.n_actions,
-                    env.n_features,
-                    learning_rate=1e-4,
-                    reward_decay=0.95,
-                    e_greedy=0.99,
-                    start_epsilon=0.5,
-                    e_greedy_increment=1e-5)
-    train_2048()
+    # TensorFlow is imported here, the spawned evaluate.py workers re-import this module as __mp_main__
+    from RL_brain import DuelingDQN
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agent', choices=['dqn', 'ntuple'], default='dqn',
+                        help="DuelingDQN or the n-tuple network of ntuple.py")
+    parser.add_argument('--ntuple-tuples', choices=sorted(TUPLE_SETS), default='6',
+                        help="tuple set of the n-tuple network, see ntuple.TUPLE_SETS")
+    parser.add_argument('--ntuple-lr', type=float, default=0.1)
+    parser.add_argument('--ntuple-weights',
+                        help="n-tuple weights .npz, loaded when it exists and written when training stops")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='bitboard',
+                        help="game backend, both play identical games")
+    parser.add_argument('--one-hot', action='store_true',
+                        help="16-channel one-hot observations instead of exponent / 10, needs --memory dense")
+    parser.add_argument('--memory', choices=sorted(MEMORIES), default='dense',
+                        help="replay memory layout, see replay.py")
+    parser.add_argument('--memory-size', type=int, default=500)
+    parser.add_argument('--memory-path', default='replay_memmap', help="directory of the memmap memory")
+    parser.add_argument('--symmetry', choices=['none', 'sample', 'expand'], default='none',
+                        help="augment with the 8 board symmetries: a random one per sampled transition, "
+                             "or all of them stored at write time")
+    parser.add_argument('--n-step', type=int, default=1,
+                        help="store n-step returns and bootstrap with reward_decay ** n")
+    parser.add_argument('--fused-learn', action='store_true',
+                        help="compute the target inside the graph, one session call per update")
+    parser.add_argument('--double-q', action='store_true', help="Double-DQN target, needs --fused-learn")
+    parser.add_argument('--mask-legal', action='store_true',
+                        help="choose and bootstrap only from moves that change the board")
+    parser.add_argument('--record', help="append every played game to this trajectory file, see trajectory.py")
+    parser.add_argument('--seed', type=int,
+                        help="seed of the tile and exploration random numbers, also written to --record files; "
+                             "drawn and printed when omitted")
+    parser.add_argument('--threaded', action='store_true',
+                        help="act and learn in two threads, see pipeline.py")
+    parser.add_argument('--replay-ratio', type=float, default=0.1,
+                        help="with --threaded, updates per stored transition")
+    parser.add_argument('--eval-every', type=int, default=0,
+                        help="episodes between greedy evaluations in background processes, see evaluate.py")
+    parser.add_argument('--eval-games', type=int, default=100)
+    parser.add_argument('--eval-workers', type=int, default=1)
+    parser.add_argument('--spectate', nargs='?', const=DEFAULT_NAME,
+                        help="publish the current game for python -m env.UI --spectate, see env/spectator.py")
+    parser.add_argument('--spectate-interval', type=float, default=0.05, help="seconds between published boards")
+    parser.add_argument('--metrics', help="append per-episode metrics to this .jsonl or .csv file")
+    parser.add_argument('--metrics-flush', type=int, default=100, help="rows buffered between writes")
+    parser.add_argument('--profile', action='store_true', help="print per-phase timings")
+    parser.add_argument('--profile-interval', type=int, default=10000, help="steps between profile reports")
+    parser.add_argument('--trace-dir', help="with --profile, write a TF timeline of one learn() per report")
+    parser.add_argument('--checkpoint-dir', help="write checkpoints here, also on SIGTERM/SIGINT")
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help="episodes between checkpoints")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the run saved in --checkpoint-dir with its original arguments")
+    parser.add_argument('--export-weights', help="with --resume, write the eval_net weights to this .npz and exit")
+    parser.add_argument('--export-dtype', choices=DTYPES, default='float32')
+    args = parser.parse_args()
+    if args.threaded and (args.profile or args.checkpoint_dir or args.eval_every):
+        parser.error("--threaded does not support --profile, --checkpoint-dir and --eval-every")
+    if args.one_hot and args.memory != 'dense':
+        parser.error("--one-hot needs --memory dense, the other memories pack exponent observations")
+    if args.agent == 'ntuple' and (args.threaded or args.checkpoint_dir or args.eval_every or args.trace_dir):
+        parser.error("--agent ntuple does not support --threaded, --checkpoint-dir, --eval-every and --trace-dir")
+    export_args = args
+    if args.resume:
+        # options added after the checkpoint was written keep their defaults
+        resume_args = dict(vars(parser.parse_args([])), **load_args(args.checkpoint_dir))
+        resume_args.update(checkpoint_dir=args.checkpoint_dir, resume=True)
+        args = argparse.Namespace(**resume_args)
+    if args.seed is None:
+        args.seed = random.SystemRandom().randrange(2 ** 31)
+    print("seed:", args.seed)
+    # a resumed run continues from the generator states of its checkpoint
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    # train_2048 keeps only the current and the next observation, so the env may reuse two buffers
+    env = ENGINES[args.engine](one_hot=args.one_hot, reuse_observations=True)
+    reward_decay = 0.95
+    if args.agent == 'ntuple':
+        if args.ntuple_weights and os.path.exists(args.ntuple_weights):
+            RL = NTupleAgent.load(args.ntuple_weights, learning_rate=args.ntuple_lr)
+        else:
+            RL = NTupleAgent(env.n_actions, env.n_features, args.ntuple_tuples, args.ntuple_lr)
+    else:
+        RL = DuelingDQN(env.n_actions,
+                        env.n_features,
+                        learning_rate=1e-4,
+                        reward_decay=reward_decay,
+                        e_greedy=0.99,
+                        start_epsilon=0.5,
+                        e_greedy_increment=1e-5,
+                        memory_size=args.memory_size,
+                        memory=make_memory(args, env.n_features, reward_decay),
+                        fused_learn=args.fused_learn,
+                        double_q=args.double_q,
+                        mask_legal=args.mask_legal,
+                        n_step=args.n_step)
+    profiler = PhaseProfiler(args.profile_interval, trace_dir=args.trace_dir) if args.profile else None
+
+    checkpointer = None
+    train_state = None
+    if args.checkpoint_dir:
+        checkpointer = Checkpointer(args.checkpoint_dir, args.checkpoint_every, vars(args))
+        checkpointer.install_signal_handlers()
+        if args.resume:
+            train_state = load_checkpoint(args.checkpoint_dir, RL)
+            env = train_state['env']
+            if export_args.export_weights:
+                RL.export_weights(export_args.export_weights, export_args.export_dtype)
+                raise SystemExit
+    if args.record and env.recorder is None:
+        env.recorder = TrajectoryWriter(args.record, args.seed)
+    if train_state is not None and 'metrics' in train_state:
+        metrics = train_state['metrics']
+    else:
+        metrics = Metrics(sink=MetricsSink(args.metrics, args.metrics_flush) if args.metrics else None)
+    spectator = SpectatorSlot(args.spectate, create=True, interval=args.spectate_interval) if args.spectate else None
+    evaluator = None
+    if args.eval_every > 0:
+        evaluator = Evaluator(args.eval_games, args.eval_workers, args.eval_every, engine=args.engine,
+                              one_hot=args.one_hot)
+    try:
+        if args.threaded:
+            train_threaded(env, RL, args.replay_ratio, metrics=metrics, spectator=spectator)
+        else:
+            train_2048(env, RL, profiler=profiler, checkpointer=checkpointer, train_state=train_state,
+                       evaluator=evaluator, metrics=metrics, spectator=spectator)
+    finally:
+        # also on Ctrl-C, n-tuple runs have no checkpoints
+        if args.agent == 'ntuple' and args.ntuple_weights:
+            RL.save(args.ntuple_weights)
+        if spectator is not None:
+            spectator.close()
+        # the memmap memory keeps its last chunk in RAM
+        if getattr(RL, 'memory', None) is not None and hasattr(RL.memory, 'close'):
+            RL.memory.close()
+        metrics.close()
+        if evaluator is not None:
+            evaluator.close()
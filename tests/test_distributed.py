@@ -0,0 +1,92 @@
+import socket
+import threading
+import numpy as np
+from distributed import (HEADER, MAX_MESSAGE, TRANSITIONS, ReplayClient, ReplayServer, decode_batch, encode_batch,
+                         recv_message, send_message)
+from numpy_policy import PARAM_NAMES
+from pipeline import LockedMemory, ReplayRatioLimiter
+from replay import PackedMemory
+
+
+def batch(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.integers(0, 2 ** 63, n, dtype=np.uint64), rng.integers(0, 4, n).astype(np.uint8),
+            rng.random(n).astype(np.float32), rng.integers(0, 2 ** 63, n, dtype=np.uint64), rng.random(n) < 0.2)
+
+
+def test_batch_roundtrip():
+    arrays = batch()
+    decoded, scores = decode_batch(bytearray(encode_batch(*arrays, scores=[1024, 96])))
+    for x, y in zip(decoded, arrays):
+        np.testing.assert_array_equal(x, y)
+    assert scores.tolist() == [1024, 96]
+
+
+def test_framing_survives_fragmented_reads():
+    a, b = socket.socketpair()
+    payload = encode_batch(*batch(300))
+    message = bytearray()
+
+    def receive():
+        message.extend(recv_message(b)[1])
+
+    thread = threading.Thread(target=receive)
+    thread.start()
+    framed = bytearray()
+    send_message(_Collect(framed), TRANSITIONS, payload)
+    for i in range(0, len(framed), 7):
+        a.sendall(framed[i:i + 7])
+    thread.join(timeout=5)
+    assert bytes(message) == payload
+    a.close()
+    b.close()
+
+
+class _Collect:
+    def __init__(self, buf):
+        self.buf = buf
+
+    def sendall(self, data):
+        self.buf.extend(data)
+
+
+def test_server_stores_batches_and_serves_weights():
+    memory = LockedMemory(PackedMemory(1000))
+    limiter = ReplayRatioLimiter(0.1, learn_start=10 ** 6)
+    server = ReplayServer(memory, limiter, {'engine': 'bitboard'}, port=0)
+    try:
+        client = ReplayClient(*server.address[:2])
+        assert client.config == {'engine': 'bitboard', 'worker_id': 0}
+        assert client.get_weights() == (-1, None)
+
+        values = [np.full((2, 3), i, dtype=np.float32) for i in range(len(PARAM_NAMES))]
+        server.publish(values)
+        arrays = batch()
+        assert client.send_transitions(*arrays, scores=[512]) == 1
+        assert len(memory.memory) == 50 and limiter.transitions == 50
+        np.testing.assert_array_equal(memory.s[:50], arrays[0])
+        assert server.drain_scores() == [512]
+
+        version, received = client.get_weights()
+        assert version == 1
+        for x, y in zip(received, values):
+            np.testing.assert_array_equal(x, y)
+        assert client.get_weights(version) == (1, None)
+        client.close()
+    finally:
+        server.close()
+
+
+def test_server_publishes_initial_weights_and_drops_oversized_frames():
+    values = [np.full((2, 3), i, dtype=np.float32) for i in range(len(PARAM_NAMES))]
+    server = ReplayServer(LockedMemory(PackedMemory(100)), ReplayRatioLimiter(0.1), {}, port=0, values=values)
+    try:
+        client = ReplayClient(*server.address[:2])
+        version, received = client.get_weights()
+        assert version == 1 and len(received) == len(values)
+        client.sock.sendall(HEADER.pack(TRANSITIONS, MAX_MESSAGE + 1))
+        client.sock.settimeout(5)
+        assert client.sock.recv(1) == b''  # the server closed the connection
+        client.close()
+    finally:
+        server.close()
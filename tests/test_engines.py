@@ -0,0 +1,60 @@
+import random
+import numpy as np
+import pytest
+from env import vec_game
+from env.bitboard import BitboardGame, field_to_board, is_finished_board, legal_actions_board, move_board
+from env.game import Game
+
+
+def play(engine, seed, n_moves=2000):
+    """
+    This function plays one game with seeded random moves and returns the
+    trace of (observation, reward, done, field, score, legal) per step.
+    """
+    random.seed(seed)
+    actions = np.random.RandomState(seed)
+    env = engine()
+    trace = [(env.reset().copy(), 0, False, env.field, env.score, env.legal_actions().copy())]
+    for _ in range(n_moves):
+        observation, reward, done = env.step(actions.randint(4))
+        assert done == env.is_finished()
+        trace.append((observation.copy(), reward, done, env.field, env.score, env.legal_actions().copy()))
+        if done:
+            break
+    return trace
+
+
+def game_boards(n_games=10):
+    boards = []
+    for seed in range(n_games):
+        boards.extend(field_to_board(step[3]) for step in play(BitboardGame, seed))
+    return boards
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_bitboard_plays_like_game(seed):
+    expected = play(Game, seed)
+    actual = play(BitboardGame, seed)
+    assert len(actual) == len(expected)
+    assert expected[-1][2]
+    for (obs, reward, done, field, score, legal), (obs_, reward_, done_, field_, score_, legal_) in zip(expected, actual):
+        np.testing.assert_array_equal(obs_, obs)
+        assert (reward_, done_, field_, score_) == (reward, done, field, score)
+        np.testing.assert_array_equal(legal_, legal)
+
+
+def test_vec_game_moves_like_bitboard():
+    boards = game_boards()
+    exponents = np.array([[(b >> (4 * i)) & 0xF for i in range(16)] for b in boards], dtype=np.uint8)
+    np.testing.assert_array_equal(vec_game.legal_actions(exponents), [legal_actions_board(b) for b in boards])
+
+    env = vec_game.VecGame(len(boards), seed=0)
+    for direction in range(4):
+        env.boards[:] = exponents
+        scores = env.move(np.full(len(boards), direction))
+        for board, row, score in zip(boards, env.boards, scores):
+            new, expected_score = move_board(board, direction)
+            assert field_to_board([[1 << int(e) if e else 0 for e in row[4 * y:4 * y + 4]] for y in range(4)]) == new
+            assert score == expected_score
+    env.boards[:] = exponents
+    np.testing.assert_array_equal(env.is_finished(), [is_finished_board(b) for b in boards])
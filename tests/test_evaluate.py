@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from evaluate import Evaluator, weights_one_hot
+
+
+def random_weights(channels, hidden=32, seed=0):
+    rng = np.random.default_rng(seed)
+    shapes = [(1, 1, channels, 64), (64,), (4, 1, 64, 128), (128,), (1, 4, 64, 128), (128,),
+              (8 * 128, hidden), (hidden,), (hidden, 1), (1,), (hidden, 4), (4,)]
+    return [rng.normal(0, 0.1, shape).astype(np.float32) for shape in shapes]
+
+
+@pytest.mark.parametrize('one_hot', [False, True])
+def test_evaluator_plays_with_the_observations_of_the_weights(one_hot):
+    values = random_weights(16 if one_hot else 1)
+    assert weights_one_hot(values) == one_hot
+    evaluator = Evaluator(n_games=2, workers=1, one_hot=one_hot, max_moves=50)
+    try:
+        evaluator.submit(values)
+        _, stats = evaluator.poll(wait=True)
+    finally:
+        evaluator.close()
+    assert stats['games'] == 2 and stats['min_score'] >= 0
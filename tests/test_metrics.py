@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from metrics import Metric, QuantileSketch
+
+
+@pytest.mark.parametrize('loc', [1000., 0.])
+def test_quantile_sketch_within_accuracy(loc):
+    values = np.random.default_rng(0).normal(loc, 100, 5001)
+    sketch = QuantileSketch(accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    for q in [0., 0.1, 0.5, 0.9, 0.99, 1.]:
+        expected = np.quantile(values, q, method='lower')
+        assert sketch.quantile(q) == pytest.approx(expected, rel=0.0201)
+
+
+def test_quantile_sketch_zero_and_remove():
+    sketch = QuantileSketch()
+    for value in [-5., 0., 1e-9, 5.]:
+        sketch.add(value)
+    assert sketch.quantile(0.) < 0 < sketch.quantile(1.)
+    assert sketch.quantile(0.5) == 0.
+    sketch.remove(-5.)
+    assert sketch.quantile(0.) == 0.
+
+
+def test_metric_window_quantiles():
+    metric = Metric(window=100)
+    for value in range(-200, 200):
+        metric.add(value)
+    assert metric.mean == pytest.approx(149.5)
+    assert metric.quantile(0.) == pytest.approx(100, rel=0.02)
+    assert metric.quantile(1.) == pytest.approx(199, rel=0.02)
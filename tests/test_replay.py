@@ -0,0 +1,173 @@
+import random
+import numpy as np
+import pytest
+from env.bitboard import BitboardGame, move_board
+from offline import game_transitions, n_step_transitions
+from replay import (SYMMETRY_ACTIONS, SYMMETRY_CELLS, MemmapMemory, NStepMemory, PackedMemory, PrioritizedMemory,
+                    SumTree, SymmetricMemory, Memory, apply_symmetries, pack_state, pack_states, unpack_states)
+from tests.test_engines import game_boards
+
+
+def board_exponents(board):
+    return np.array([(board >> (4 * i)) & 0xF for i in range(16)])
+
+
+def exponents_board(exponents):
+    return sum(int(e) << (4 * i) for i, e in enumerate(exponents))
+
+
+def test_pack_roundtrip():
+    observations = np.array([board_exponents(b) / 10 for b in game_boards(2)])
+    boards = pack_states(observations)
+    np.testing.assert_allclose(unpack_states(boards), observations, atol=1e-6)
+    scratch = np.empty(16)
+    assert [pack_state(o, scratch) for o in observations] == boards.tolist()
+
+
+def test_symmetry_actions_commute_with_moves():
+    for board in game_boards(2)[::7]:
+        exponents = board_exponents(board)
+        for cells, actions in zip(SYMMETRY_CELLS, SYMMETRY_ACTIONS):
+            for action in range(4):
+                moved, score = move_board(board, action)
+                moved_sym, score_sym = move_board(exponents_board(exponents[cells]), actions[action])
+                assert moved_sym == exponents_board(board_exponents(moved)[cells])
+                assert score_sym == score
+
+
+def test_symmetric_memory_expand_matches_apply_symmetries():
+    s = np.random.RandomState(0).randint(0, 12, size=16) / 10
+    s_ = np.random.RandomState(1).randint(0, 12, size=16) / 10
+    memory = SymmetricMemory(Memory(8, 16), expand=True)
+    memory.store(s, 2, 0.5, s_, False)
+    rows = memory.memory.memory
+    expected = apply_symmetries(np.tile(s, (8, 1)), np.full(8, 2), np.tile(s_, (8, 1)), np.arange(8))
+    np.testing.assert_allclose(rows[:, :16], expected[0])
+    np.testing.assert_array_equal(rows[:, 16], expected[1])
+    np.testing.assert_allclose(rows[:, 18:34], expected[2])
+
+
+def test_sum_tree_update_and_sampling():
+    rng = np.random.RandomState(0)
+    tree, tree_one = SumTree(100), SumTree(100)
+    priorities = rng.uniform(size=100)
+    tree.update(np.arange(100), priorities)
+    for i, p in enumerate(priorities):
+        tree_one.update_one(i, p)
+    np.testing.assert_allclose(tree_one.tree, tree.tree)
+    assert tree.total() == pytest.approx(priorities.sum())
+
+    values = rng.uniform(0, tree.total(), size=1000)
+    expected = np.searchsorted(np.cumsum(priorities), values, side='right')
+    np.testing.assert_array_equal(tree.get_leaves(values), expected)
+
+
+def test_store_packed_wraps_around():
+    rng = np.random.default_rng(0)
+    s = rng.integers(0, 2 ** 63, 300, dtype=np.uint64)
+    a = rng.integers(0, 4, 300).astype(np.uint8)
+    r = rng.random(300).astype(np.float32)
+    done = rng.random(300) < 0.1
+    for memory in [PackedMemory(256), PrioritizedMemory(256)]:
+        memory.store_packed(s, a, r, s[::-1], done)
+        assert len(memory) == 256 and memory.memory_index == 44
+        np.testing.assert_array_equal(memory.s[:44], s[256:])
+        np.testing.assert_array_equal(memory.s[44:], s[44:256])
+    assert memory.tree.total() == pytest.approx(256 * memory.max_priority)
+
+
+def test_memmap_memory_checkpoint_and_reopen(tmp_path):
+    observations = np.arange(2 * 40 * 16).reshape(80, 16) % 12 / 10
+    memory = MemmapMemory(64, path=str(tmp_path), chunk_size=8)
+    for i in range(20):
+        memory.store(observations[i], i % 4, i, observations[i + 1])
+    arrays, values = memory.get_state()
+    assert (values['memory_index'], values['memory_counter']) == (20, 20)
+    for i in range(20, 30):
+        memory.store(observations[i], i % 4, i, observations[i + 1])
+    memory.close()
+    assert MemmapMemory(64, path=str(tmp_path)).memory_counter == 30
+
+    memory.set_state(arrays, values)
+    assert (memory.memory_index, memory.memory_counter, len(memory)) == (20, 20, 20)
+    assert MemmapMemory(64, path=str(tmp_path)).memory_counter == 20
+    np.testing.assert_array_equal(memory.r[:30], np.arange(30))
+    with pytest.raises(ValueError):
+        MemmapMemory(128, path=str(tmp_path))
+
+
+def record_games(n_games, path):
+    from trajectory import TrajectoryWriter
+    random.seed(1)
+    actions = np.random.RandomState(1)
+    env = BitboardGame(reuse_observations=True)
+    env.recorder = TrajectoryWriter(str(path))
+    transitions = []
+    for _ in range(n_games):
+        observation = env.reset()
+        done = False
+        while not done:
+            action = actions.randint(4)
+            observation_, reward, done = env.step(action)
+            transitions.append((observation.copy(), action, reward, observation_.copy(), done))
+            observation = observation_
+    env.recorder.close()
+    return transitions
+
+
+def test_n_step_memory_matches_offline_and_direct_returns(tmp_path):
+    from trajectory import read_games
+    n, gamma = 3, 0.9
+    transitions = record_games(3, tmp_path / 'games.trj')
+    memory = NStepMemory(PackedMemory(10000), n, gamma)
+    for t in transitions:
+        memory.store(*t)
+
+    expected = []
+    start = 0
+    for end in [i for i, t in enumerate(transitions) if t[4]]:
+        for i in range(start, end + 1):
+            last = min(i + n - 1, end)
+            ret = sum(gamma ** (k - i) * transitions[k][2] for k in range(i, last + 1))
+            expected.append((pack_states(transitions[i][0]), transitions[i][1], ret,
+                             pack_states(transitions[last][3]), transitions[last][4]))
+        start = end + 1
+    packed = memory.memory
+    k = len(packed)
+    assert k == len(expected)
+    s, a, r, s_, done = (np.array(x) for x in zip(*expected))
+    np.testing.assert_array_equal(packed.s[:k], s)
+    np.testing.assert_array_equal(packed.a[:k], a)
+    np.testing.assert_allclose(packed.r[:k], r, atol=1e-4)
+    np.testing.assert_array_equal(packed.s_[:k], s_)
+    np.testing.assert_array_equal(packed.done[:k], done)
+
+    parts = [n_step_transitions(game_transitions(board, steps, summary is not None), summary is not None, n, gamma)
+             for _, board, steps, summary in read_games(str(tmp_path / 'games.trj'))]
+    for x, y in zip((np.concatenate(p) for p in zip(*parts)), (packed.s, packed.a, packed.r, packed.s_, packed.done)):
+        np.testing.assert_allclose(x.astype(np.float64), y[:k].astype(np.float64), atol=1e-4)
+
+
+def test_n_step_memory_drops_window_of_truncated_episode():
+    memory = NStepMemory(PackedMemory(100), 3, 0.9)
+    random.seed(0)
+    env = BitboardGame()
+    observation = env.reset()
+    observation_, reward, done = env.step(0)
+    memory.store(observation, 0, reward, observation_, done)
+    observation = env.reset()
+    observation_, reward, done = env.step(1)
+    memory.store(observation, 1, reward, observation_, done)
+    assert len(memory.states) == 1 and len(memory) == 0
+
+
+def test_prioritized_weights_stay_finite_on_empty_leaf(monkeypatch):
+    memory = PrioritizedMemory(64)
+    observation = np.zeros(16)
+    for _ in range(10):
+        memory.store(observation, 0, 0., observation)
+    # a prefix search that rounds onto a leaf of priority 0
+    monkeypatch.setattr(memory.tree, 'get_leaves', lambda values: np.full(len(values), 9))
+    memory.tree.update([9], [0.])
+    is_weights = memory.sample(8)[-1]
+    assert np.isfinite(is_weights).all() and is_weights.max() == 1
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from replay import Memory
+
+tf = pytest.importorskip('tensorflow')
+if not hasattr(tf, 'placeholder'):
+    pytest.skip("RL_brain needs the TF1 graph API", allow_module_level=True)
+
+
+def test_legacy_learn_does_not_bootstrap_done_transitions():
+    from RL_brain import DuelingDQN
+    rng = np.random.default_rng(0)
+    memory = Memory(4, 16)
+    transitions = [(rng.integers(0, 8, 16) / 10, a, float(a + 1), rng.integers(0, 8, 16) / 10, a % 2 == 0)
+                   for a in range(4)]
+    for transition in transitions:
+        memory.store(*transition)
+    with tf.Graph().as_default():
+        RL = DuelingDQN(4, 16, memory=memory, batch_size=64)
+        fed = []
+        run = RL.sess.run
+
+        def capture(fetches, feed_dict=None, **kwargs):
+            if feed_dict is not None and RL.q_target in feed_dict:
+                fed.append((feed_dict[RL.s], feed_dict[RL.q_target]))
+            return run(fetches, feed_dict=feed_dict, **kwargs)
+        RL.sess.run = capture
+        RL.learn()
+        RL.sess.close()
+    s, q_target = fed[0]
+    for observation, a, reward, observation_, done in transitions:
+        rows = (s == observation).all(axis=1)
+        assert rows.any()
+        if done:
+            np.testing.assert_allclose(q_target[rows, a], reward, rtol=1e-6)
+        else:
+            assert not np.isclose(q_target[rows, a], reward).any()
+
+
+@pytest.mark.parametrize('fused_learn', [False, True])
+def test_target_sync_copies_the_weights_the_graph_uses(fused_learn):
+    from RL_brain import DuelingDQN
+    rng = np.random.default_rng(1)
+    memory = Memory(8, 16)
+    for a in range(8):
+        memory.store(rng.integers(0, 8, 16) / 10, a % 4, 1., rng.integers(0, 8, 16) / 10)
+    with tf.Graph().as_default():
+        RL = DuelingDQN(4, 16, memory=memory, batch_size=8, replace_target_iter=2, fused_learn=fused_learn)
+        # the fused update syncs at the end of the second learn(), the legacy one before its train op
+        RL.learn()
+        if fused_learn:
+            RL.learn()
+        else:
+            RL.sess.run(RL.replace_target_op)
+        for t, e in zip(RL.sess.run(RL.t_params), RL.sess.run(RL.e_params)):
+            np.testing.assert_array_equal(t, e)
+        s = memory.sample(8)[0]
+        np.testing.assert_allclose(RL.sess.run(RL.q_next, {RL.s_: s}), RL.sess.run(RL.q_eval, {RL.s: s}), rtol=1e-6)
+        RL.sess.close()
@@ -0,0 +1,53 @@
+import random
+import numpy as np
+import pytest
+from env.bitboard import field_to_board
+from env.engines import ENGINES
+from trajectory import TrajectoryWriter, read_games, replay_game
+
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_recorded_games_replay_exactly(tmp_path, engine):
+    path = str(tmp_path / 'games.trj')
+    random.seed(3)
+    actions = np.random.RandomState(3)
+    env = ENGINES[engine]()
+    env.recorder = TrajectoryWriter(path, seed=3)
+    played = []
+    for _ in range(3):
+        env.reset()
+        boards, rewards = [field_to_board(env.field)], []
+        done = False
+        while not done:
+            _, reward, done = env.step(actions.randint(4))
+            boards.append(field_to_board(env.field))
+            rewards.append(reward)
+        played.append((boards, rewards, env.score, env.round))
+    env.reset()
+    env.step(0)  # unfinished last game
+    env.recorder.close()
+
+    games = list(read_games(path, chunk_size=7))
+    assert len(games) == 4 and games[-1][3] is None
+    assert all(game[0] == 3 for game in games)
+    for (boards, rewards, score, rounds), (_, board, steps, summary) in zip(played, games):
+        replayed = list(replay_game(board, steps))
+        assert [board] + [step[3] for step in replayed] == boards
+        assert [step[2] for step in replayed] == pytest.approx(rewards)
+        assert sum(step[4] for step in replayed) == score
+        assert summary[:2] == (score, rounds)
+
+
+def test_truncated_file_drops_partial_record(tmp_path):
+    path = str(tmp_path / 'games.trj')
+    random.seed(0)
+    env = ENGINES['bitboard']()
+    env.recorder = TrajectoryWriter(path)
+    env.reset()
+    for action in [0, 1, 2]:
+        env.step(action)
+    env.recorder.close()
+    with open(path, 'rb+') as f:
+        f.truncate(f.seek(0, 2) - 2)
+    (_, _, steps, summary), = read_games(path)
+    assert len(steps) == 2 and summary is None
@@ -0,0 +1,176 @@
+"""
+Append-only binary log of played games, written by a TrajectoryWriter set
+as env.recorder of Game or BitboardGame.
+    python trajectory.py games.trj [--verify]
+The file starts with MAGIC, followed by little-endian records whose first
+byte holds the record kind in the high nibble:
+ - start  0x10, seed int64, initial board uint64                  17 bytes
+          seed of the run that played the game, -1 when unknown
+ - step   0x0F bits: spawned << 3 | four << 2 | action,
+          spawned cell uint8, reward float32                        6 bytes
+ - end    0x20, score uint32, rounds uint32, max tile exponent     10 bytes
+Boards are 64-bit boards of 4-bit tile exponents, see env/bitboard.py.
+"""
+import argparse
+import os
+import struct
+import time
+import numpy as np
+from env.bitboard import field_to_board, move_board
+
+MAGIC = b'2048TRJ1'
+START = struct.Struct('<BqQ')
+STEP = struct.Struct('<BBf')
+END = struct.Struct('<BIIB')
+KIND_STEP, KIND_START, KIND_END = 0x00, 0x10, 0x20
+RECORDS = {KIND_STEP: STEP, KIND_START: START, KIND_END: END}
+
+
+def env_board(env):
+    return env.board if hasattr(env, 'board') else field_to_board(env.field)
+
+
+class TrajectoryWriter:
+    """
+    Class TrajectoryWriter
+    Appends the games of an environment to a trajectory file: the board
+    after reset(), the action, random tile and reward of every step() and
+    a summary when the game is done. Records are collected in a bytearray
+    and written once per game or when flush_size bytes are pending.
+    """
+    def __init__(self, path, seed=-1, flush_size=1 << 16):
+        self.path = path
+        self.seed = seed
+        self.flush_size = flush_size
+        self.buffer = bytearray()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        if new_file:
+            self.file.write(MAGIC)
+
+    def start_game(self, env):
+        self.buffer += START.pack(KIND_START, self.seed, env_board(env))
+
+    def record_step(self, env, action, reward, done):
+        board = env_board(env)
+        flags = action
+        cell = 0
+        if env.spawn:
+            y, x = env.spawn
+            cell = 4 * y + x
+            flags |= 0x8 | (((board >> (4 * cell)) & 0xF) == 2) << 2
+        self.buffer += STEP.pack(flags, cell, reward)
+        if done:
+            max_exponent = max((board >> (4 * i)) & 0xF for i in range(16))
+            self.buffer += END.pack(KIND_END, env.score, env.round, max_exponent)
+            self.flush()
+        elif len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        del self.buffer[:]
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __getstate__(self):
+        # a pickled environment (checkpoint) reopens the file on load
+        self.flush()
+        return {'path': self.path, 'seed': self.seed, 'flush_size': self.flush_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['seed'], state['flush_size'])
+
+
+def read_games(path, chunk_size=1 << 20):
+    """
+    This generator yields every game of a trajectory file as
+    (seed, board, steps, summary) while reading the file in chunks.
+    steps is a list of (action, cell, exponent, reward) with cell -1 when
+    no tile was spawned, summary is (score, rounds, max tile exponent) or
+    None for a game that was not finished.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a trajectory file".format(path))
+        data = b''
+        pos = 0
+        game = None
+        while True:
+            if len(data) - pos < START.size:  # longest record
+                data = data[pos:]
+                pos = 0
+                while len(data) < START.size:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    data += chunk
+            if pos == len(data):
+                break
+            kind = data[pos] & 0xF0
+            if kind not in RECORDS:
+                raise ValueError("corrupt record at byte {}".format(f.tell() - len(data) + pos))
+            if len(data) - pos < RECORDS[kind].size:
+                break  # truncated last record
+            if kind == KIND_STEP:
+                flags, cell, reward = STEP.unpack_from(data, pos)
+                if flags & 0x8:
+                    game[2].append((flags & 0x3, cell, 2 if flags & 0x4 else 1, reward))
+                else:
+                    game[2].append((flags & 0x3, -1, 0, reward))
+            elif kind == KIND_START:
+                if game is not None:
+                    yield game
+                _, seed, board = START.unpack_from(data, pos)
+                game = (seed, board, [], None)
+            else:
+                yield game[:3] + (END.unpack_from(data, pos)[1:],)
+                game = None
+            pos += RECORDS[kind].size
+        if game is not None:
+            yield game
+
+
+def replay_game(board, steps):
+    """
+    This generator re-simulates a recorded game from its initial board and
+    yields (board, action, reward, next_board, score) for every step; score
+    is the score gained by the move.
+    """
+    for action, cell, exponent, reward in steps:
+        new, score = move_board(board, action)
+        if cell >= 0:
+            new |= exponent << (4 * cell)
+        yield board, action, reward, new, score
+        board = new
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--verify', action='store_true', help="re-simulate every game and check its score")
+    args = parser.parse_args()
+
+    start = time.time()
+    games = steps = finished = 0
+    scores = []
+    for seed, board, game_steps, summary in read_games(args.path):
+        games += 1
+        steps += len(game_steps)
+        if summary is not None:
+            finished += 1
+            scores.append(summary[0])
+            if args.verify:
+                score = sum(step[4] for step in replay_game(board, game_steps))
+                assert score == summary[0], "game {} replays to score {}, recorded {}".format(
+                    games - 1, score, summary[0])
+    elapsed = time.time() - start
+    size = os.path.getsize(args.path)
+    print("games: {} ({} finished), steps: {}, {:.2f} bytes/step".format(
+        games, finished, steps, size / max(steps, 1)))
+    if scores:
+        print("score: mean {:.1f}, max {}".format(np.mean(scores), max(scores)))
+    print("read {:.0f} steps/sec{}".format(steps / max(elapsed, 1e-9), ", replays verified" if args.verify else ""))